@@ -0,0 +1,123 @@
+"""Verification of a batch of models in a single run.
+
+Models importing the same type libraries have the facts of those types
+in common. Type facts are thus loaded once, deduplicated by type name,
+into a module shared by all the models, while the node and policy facts
+of each model are loaded into a module of its own, which imports the
+shared one. A model defining a type differently
+from the models loaded before it is instead loaded, types included, into
+a module isolated from the shared one.
+"""
+import argparse
+import sys
+from collections import Counter
+
+from pyswip import Prolog
+
+from check2swipl import CompiledCheck, quoted_re
+from poc import (
+    MODEL_PREDICATES,
+    TYPE_PREDICATES,
+    assert_facts,
+    declare_model_predicates,
+    format_result,
+    init_prolog,
+    load_checks,
+    run_check,
+    stream_model_facts
+)
+from report import REPORTERS, Reporter
+from tosca2swipl import get_functor
+
+TYPES_MODULE = "model_types"
+INSTANCE_PREDICATES = [pred for pred in MODEL_PREDICATES if pred not in TYPE_PREDICATES]
+
+
+def get_type_name(fact: str) -> str:
+    # Type facts describe the type named by their first argument
+    return quoted_re.match(fact, fact.index("(") + 1).group() # type: ignore
+
+
+class BatchLoader:
+    def __init__(self, prolog: Prolog):
+        self.prolog = prolog
+        # Facts of each type loaded into the shared module
+        self.type_facts: dict[str, set[str]] = {}
+        declare_model_predicates(prolog, TYPES_MODULE, TYPE_PREDICATES)
+
+    def load(self, facts: list[str], module: str) -> bool:
+        """Loads the facts of a model into `module`, sharing its type facts
+        with the other models. Returns False if its types conflict with
+        those of the shared module, in which case it is loaded in
+        isolation."""
+        model_type_facts: dict[str, set[str]] = {}
+        instance_facts = []
+        for fact in facts:
+            if get_functor(fact) in TYPE_PREDICATES:
+                model_type_facts.setdefault(get_type_name(fact), set()).add(fact)
+            else:
+                instance_facts.append(fact)
+
+        if any(self.type_facts.get(type_name, type_facts) != type_facts
+                for type_name, type_facts in model_type_facts.items()):
+            assert_facts(self.prolog, facts, module)
+            return False
+
+        new_types = [type_name for type_name in model_type_facts if type_name not in self.type_facts]
+        if new_types:
+            assert_facts(self.prolog, [fact for type_name in new_types for fact in model_type_facts[type_name]],
+                TYPES_MODULE, TYPE_PREDICATES)
+            self.type_facts.update((type_name, model_type_facts[type_name]) for type_name in new_types)
+        # The type predicates are left undefined in the model's module, so
+        # that they are looked up in the shared one
+        assert_facts(self.prolog, instance_facts, module, INSTANCE_PREDICATES)
+        list(self.prolog.query(f"add_import_module({module}, {TYPES_MODULE}, start)"))
+        return True
+
+
+def verify_models(prolog: Prolog, models: list[tuple[str, str, dict[str, int]]], checks: list[CompiledCheck],
+        reporter: Reporter):
+    """Runs every check against every model, given as its path, module and
+    node lines, into a single report."""
+    reporter.start(checks)
+    for model_path, module, node_lines in models:
+        reporter.set_model(model_path, node_lines)
+        for check in checks:
+            stats: dict = {}
+            for res in run_check(prolog, check, module, stats):
+                reporter.report(check, res, format_result(check, res))
+            if stats["status"] == "inconclusive":
+                reporter.inconclusive(check, stats["reason"])
+    reporter.end()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify a batch of TOSCA models against the checks.")
+    parser.add_argument("models", nargs="+", help="TOSCA models to verify")
+    parser.add_argument("--checks", default="checks.yaml", help="checks file (default: %(default)s)")
+    parser.add_argument("--format", choices=list(REPORTERS), default="text",
+        help="output format (default: %(default)s)")
+    args = parser.parse_args()
+
+    prolog = init_prolog()
+    loader = BatchLoader(prolog)
+    models = []
+    counts: Counter = Counter()
+    for i, model_path in enumerate(args.models):
+        try:
+            fact_stream, _, node_lines = stream_model_facts(model_path)
+            facts = list(fact_stream)
+        except Exception as e:
+            print(f"{model_path}: {e}", file=sys.stderr)
+            continue
+        module = f"model_{i}"
+        if not loader.load(facts, module):
+            print(f"{model_path}: types differ from those of the models before it, loaded in isolation",
+                file=sys.stderr)
+        counts.update(get_functor(fact) for fact in facts)
+        models.append((model_path, module, node_lines))
+
+    # The checks are planned for the average model of the batch
+    fact_counts = {pred: counts[pred] // max(len(models), 1) for pred in MODEL_PREDICATES}
+    checks = load_checks(prolog, args.checks, fact_counts)
+    verify_models(prolog, models, checks, REPORTERS[args.format](sys.stdout, "", {}))
@@ -0,0 +1,288 @@
+"""Benchmark of the verification pipeline on synthetic TOSCA models.
+
+Models are generated with a controllable number of node templates, depth
+of the custom type hierarchies, requirement fan-out and occurrence bounds,
+properties per node and number of policies. Each phase of the pipeline is
+timed on every model, bypassing the caches of checks and facts, and the
+timings are written to a JSON file that can be compared with the one of
+another revision:
+
+    python bench.py --nodes 100 1000 --type-depth 2 5 --output new.json
+    python bench.py --nodes 100 1000 --type-depth 2 5 --compare old.json
+
+With --memory, the memory taken by each phase is recorded as well.
+
+The startup file is built once, untimed, in a temporary cache directory;
+the consult_predicates phase times loading it, as it timed consulting the
+Prolog sources in earlier revisions.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+import yaml
+from yaml.loader import Loader
+
+import cache
+from cache import build_checks_source, store_facts
+from check2swipl import build_check_pred, quote
+from poc import (
+    collect_types,
+    get_fact_counts,
+    init_prolog,
+    iter_facts,
+    load_facts_file,
+    load_tosca,
+    parse_model,
+    retract_facts,
+    run_check
+)
+
+
+def generate_model(nodes: int = 100, type_depth: int = 3, fan_out: int = 2,
+        occurrences: tuple[int, str] = (0, "UNBOUNDED"), properties: int = 4,
+        policies: int = 2, seed: int = 0) -> dict:
+    """Generates a TOSCA template with `nodes` node templates of a node type
+    `type_depth` levels below tosca.nodes.Root, each with `properties`
+    properties and `fan_out` requirements towards other nodes, bounded by
+    `occurrences`, and `policies` policies."""
+    occ_min, occ_max = occurrences
+    if type_depth < 1:
+        raise ValueError("The type hierarchy must be at least one level deep")
+    if fan_out >= nodes:
+        raise ValueError("The fan-out must be lower than the number of nodes")
+    if fan_out < int(occ_min) or (occ_max != "UNBOUNDED" and fan_out > int(occ_max)):
+        raise ValueError("The fan-out must be within the occurrence bounds")
+    rng = random.Random(seed)
+
+    cap_types = {}
+    node_types: dict[str, dict] = {}
+    for depth in range(type_depth):
+        cap_types[f"bench.capabilities.C{depth}"] = {
+            "derived_from": f"bench.capabilities.C{depth - 1}" if depth else "tosca.capabilities.Container",
+            "properties": {f"c{depth}": {"type": "integer", "required": False}}
+        }
+        node_types[f"bench.nodes.N{depth}"] = {
+            "derived_from": f"bench.nodes.N{depth - 1}" if depth else "tosca.nodes.Root",
+            "properties": {f"t{depth}": {"type": "string", "required": False}},
+            "capabilities": {f"cap{depth}": {"type": f"bench.capabilities.C{depth}"}}
+        }
+    leaf_type = f"bench.nodes.N{type_depth - 1}"
+    # The password and database endpoint give hardcoded_password some
+    # results to find
+    root_type = node_types["bench.nodes.N0"]
+    root_type["properties"]["password"] = {"type": "string", "required": False}
+    root_type["capabilities"]["database"] = {"type": "tosca.capabilities.Endpoint.Database"}
+    node_types[leaf_type]["properties"].update(
+        {f"p{i}": {"type": "integer" if i % 2 == 0 else "string"} for i in range(properties)})
+    node_types[leaf_type]["requirements"] = [{"dep": {
+        "capability": f"bench.capabilities.C{type_depth - 1}",
+        "node": leaf_type,
+        "occurrences": [occ_min, occ_max]
+    }}]
+
+    node_names = [f"n{i}" for i in range(nodes)]
+    node_tpls = {}
+    for i, name in enumerate(node_names):
+        props: dict = {f"p{j}": rng.randint(0, 1000) if j % 2 == 0 else f"value{i}_{j}"
+            for j in range(properties)}
+        props["password"] = f"secret{i}" if i % 2 == 0 else {"get_input": "password"}
+        targets = rng.sample(node_names[:i] + node_names[i + 1:], fan_out)
+        node_tpls[name] = {
+            "type": leaf_type,
+            "properties": props,
+            "capabilities": {"cap0": {"properties": {
+                "num_cpus": rng.randint(1, 8),
+                "mem_size": f"{rng.randint(1, 16)} GB"
+            }}},
+            "requirements": [{"dep": target} for target in targets]
+        }
+
+    return {
+        "tosca_definitions_version": "tosca_simple_yaml_1_3",
+        "capability_types": cap_types,
+        "node_types": node_types,
+        "topology_template": {
+            "inputs": {"password": {"type": "string", "default": "secret"}},
+            "node_templates": node_tpls,
+            "policies": [
+                {f"pol{i}": {
+                    "type": "tosca.policies.Placement",
+                    "targets": rng.sample(node_names, min(3, nodes))
+                }}
+                for i in range(policies)
+            ]
+        }
+    }
+
+
+def get_rss() -> int:
+    # Resident memory of the process, SWI-Prolog included, in bytes
+    with open("/proc/self/statm") as statm_f:
+        return int(statm_f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@contextmanager
+def phase(timings: dict[str, float], name: str, memory: Optional[dict[str, dict[str, int]]] = None):
+    if memory is not None:
+        tracemalloc.reset_peak()
+        python_start, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    if memory is not None:
+        python_end, python_peak = tracemalloc.get_traced_memory()
+        # The Python memory is traced, while that of SWI-Prolog is only
+        # seen through the resident memory of the process
+        memory[name] = {
+            "python_peak": python_peak - python_start,
+            "python_retained": python_end - python_start,
+            "rss": get_rss(),
+            "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        }
+
+
+def run_pipeline(model_path: str, checks_path: str, work_dir: str,
+        memory: Optional[dict[str, dict[str, int]]] = None) -> tuple[dict[str, float], dict[str, int]]:
+    """Runs the pipeline of poc.py on the model at `model_path`, as on a
+    miss of the caches. Returns the time taken by each phase and the
+    number of results of each check. If `memory` is given, it is filled
+    with the memory taken by each phase."""
+    timings: dict[str, float] = {}
+    with phase(timings, "parse", memory):
+        tpl, node_lines = parse_model(model_path)
+        imports = tpl.get("imports") or []
+    with phase(timings, "tosca_parser", memory):
+        tosca = load_tosca(model_path, tpl)
+        del tpl
+    with phase(timings, "type_collection", memory):
+        types = collect_types(tosca)
+    # As in poc.py, the facts are streamed into the fact cache and loaded
+    # into Prolog from there
+    with phase(timings, "fact_generation", memory):
+        facts_pl = store_facts(model_path, iter_facts(tosca, types), imports, node_lines)
+        del tosca, types
+        gc.collect()
+    # Generated models have no imports, so they can always be cached
+    assert facts_pl is not None
+    with phase(timings, "consult_predicates", memory):
+        prolog = init_prolog()
+    with phase(timings, "assert", memory):
+        load_facts_file(prolog, facts_pl)
+    with phase(timings, "check_compilation", memory):
+        with open(checks_path) as checks_f:
+            fact_counts = get_fact_counts(prolog)
+            checks = [build_check_pred(check_yaml, fact_counts) for check_yaml in yaml.load(checks_f, Loader=Loader)]
+        checks_pl = os.path.join(work_dir, "checks.pl")
+        with open(checks_pl, "w") as checks_pl_f:
+            checks_pl_f.write(build_checks_source(checks))
+        list(prolog.query(f"load_files({quote(checks_pl)}, [])"))
+    counts = {}
+    for check in checks:
+        with phase(timings, f"query:{check.name}", memory):
+            counts[check.name] = len(list(run_check(prolog, check)))
+    retract_facts(prolog)
+    return timings, counts
+
+
+def get_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_memory(memory: dict[str, dict[str, int]]):
+    for phase_name, phase_memory in memory.items():
+        print(f"  {phase_name:40} {phase_memory['python_peak'] / 2 ** 20:9.1f} MiB peak "
+            f"{phase_memory['python_retained'] / 2 ** 20:9.1f} MiB retained {phase_memory['rss'] / 2 ** 20:9.1f} MiB RSS")
+
+
+def compare(old_runs: list[dict], new_runs: list[dict]):
+    old_by_params = {json.dumps(run["params"], sort_keys=True): run for run in old_runs}
+    for run in new_runs:
+        old_run = old_by_params.get(json.dumps(run["params"], sort_keys=True))
+        if old_run is None:
+            continue
+        print(", ".join(f"{param}={value}" for param, value in run["params"].items()))
+        for phase_name, t in run["timings"].items():
+            old_t = old_run["timings"].get(phase_name)
+            ratio = f"{t / old_t:6.2f}x" if old_t else "      -"
+            old_str = f"{old_t:9.4f}s" if old_t is not None else "         -"
+            print(f"  {phase_name:40} {old_str} {t:9.4f}s {ratio}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the verification pipeline on synthetic TOSCA models. "
+        "A model is generated for each combination of the values given.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100], help="number of node templates")
+    parser.add_argument("--type-depth", type=int, nargs="+", default=[3],
+        help="depth of the custom node and capability type hierarchies")
+    parser.add_argument("--fan-out", type=int, nargs="+", default=[2], help="requirements per node template")
+    parser.add_argument("--occurrences", nargs=2, default=["0", "UNBOUNDED"], metavar=("MIN", "MAX"),
+        help="occurrence bounds of the requirement (default: 0 UNBOUNDED)")
+    parser.add_argument("--properties", type=int, nargs="+", default=[4], help="properties per node template")
+    parser.add_argument("--policies", type=int, nargs="+", default=[2], help="number of policies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1,
+        help="runs per model, of which the fastest time of each phase is kept (default: %(default)s)")
+    parser.add_argument("--checks", default="checks.yaml", help="checks file (default: %(default)s)")
+    parser.add_argument("--output", default="bench.json", help="results file (default: %(default)s)")
+    parser.add_argument("--compare", help="results file of another revision to compare with")
+    parser.add_argument("--memory", action="store_true",
+        help="record the Python memory allocated and retained by each phase, and the resident memory after it, "
+            "which slows down the pipeline")
+    args = parser.parse_args()
+    if args.memory:
+        tracemalloc.start()
+
+    occ_min, occ_max = args.occurrences
+    occurrences = (int(occ_min), occ_max if occ_max == "UNBOUNDED" else int(occ_max))
+    runs = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The caches of the user are neither used nor filled, and the
+        # startup file is built before any phase is timed
+        cache.CACHE_DIR = os.path.join(work_dir, "cache")
+        init_prolog()
+        model_path = os.path.join(work_dir, "model.yaml")
+        for nodes, type_depth, fan_out, properties, policies in itertools.product(
+                args.nodes, args.type_depth, args.fan_out, args.properties, args.policies):
+            params = {"nodes": nodes, "type_depth": type_depth, "fan_out": fan_out,
+                "occurrences": list(occurrences), "properties": properties, "policies": policies}
+            with open(model_path, "w") as model_f:
+                yaml.safe_dump(generate_model(**params, seed=args.seed), model_f, sort_keys=False)
+            best: dict[str, float] = {}
+            memory: Optional[dict[str, dict[str, int]]] = {} if args.memory else None
+            for _ in range(args.repeat):
+                timings, counts = run_pipeline(model_path, args.checks, work_dir, memory)
+                best = {name: min(t, best.get(name, t)) for name, t in timings.items()}
+            run = {"params": params, "timings": best, "results": counts}
+            if memory is not None:
+                run["memory"] = memory
+            runs.append(run)
+            print(", ".join(f"{param}={value}" for param, value in params.items())
+                + f": {sum(best.values()):.3f}s")
+            if memory is not None:
+                print_memory(memory)
+
+    with open(args.output, "w") as out_f:
+        json.dump({
+            "revision": get_revision(),
+            "python": platform.python_version(),
+            "runs": runs
+        }, out_f, indent=2)
+    if args.compare:
+        with open(args.compare) as old_f:
+            compare(json.load(old_f)["runs"], runs)
@@ -0,0 +1,21 @@
+"""Builds the startup file of the verifier ahead of its first run.
+
+The startup file is a .qlf holding `predicates.pl`, `loader.pl`,
+`profile.pl` and the facts of the normative TOSCA types, so that a run
+whose model facts are cached neither consults the Prolog sources nor
+imports tosca-parser. It is otherwise built by the first run, e.g.:
+
+    python build.py --checks checks.yaml
+"""
+import argparse
+
+from poc import init_prolog, load_checks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the startup file of the verifier.")
+    parser.add_argument("--checks", help="checks file to compile as well, with the plans used for a typical model")
+    args = parser.parse_args()
+
+    prolog = init_prolog()
+    if args.checks:
+        load_checks(prolog, args.checks)
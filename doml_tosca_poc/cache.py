@@ -0,0 +1,260 @@
+"""On-disk cache of compiled checks and of the fact bases of models.
+
+Entries are content-addressed: they are named after a hash of their
+inputs, so a changed input simply misses the cache instead of having to
+be detected and invalidated.
+"""
+import hashlib
+import json
+import math
+import os
+from importlib import metadata
+from typing import Iterable, Iterator, Optional, Union
+
+import yaml
+from yaml.loader import Loader
+try:
+    # The libyaml bindings are much faster, when available
+    from yaml import CSafeLoader as FastSafeLoader
+except ImportError:
+    from yaml import SafeLoader as FastSafeLoader  # type: ignore
+
+from check2swipl import COMPILER_VERSION, CompiledCheck, build_check_pred, quote
+from tosca2swipl import FACTS_VERSION
+
+CACHE_DIR = os.environ.get(
+    "DOML_TOSCA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "doml_tosca_poc")
+)
+# Size in bytes above which the least recently used fact bases are evicted
+FACTS_CACHE_SIZE = int(os.environ.get("DOML_TOSCA_FACTS_CACHE_SIZE", 512 * 1024 * 1024))
+# Size in bytes above which the least recently used compiled checks are
+# evicted. Each checks file is compiled anew for each size of model
+CHECKS_CACHE_SIZE = int(os.environ.get("DOML_TOSCA_CHECKS_CACHE_SIZE", 64 * 1024 * 1024))
+
+
+def write_atomically(path: str, content: Union[str, Iterable[str]]):
+    # Concurrent runs may fill the same entry, so it is written aside and
+    # moved in place: readers never see a partially written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as tmp_f:
+            if isinstance(content, str):
+                tmp_f.write(content)
+            else:
+                # Content given as lines is written as it is generated
+                tmp_f.writelines(content)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def build_checks_source(checks: list[CompiledCheck]) -> str:
+    lines = [":- style_check(-singleton)."]
+    for check in checks:
+        # Checks are module-transparent, so that context_module/1 gives
+        # them the module of the model they are called in
+        lines.append(f":- module_transparent({check.name}/{len(check.ext_vars)}).")
+        lines.append(f"{check.clause}.")
+    return "\n".join(lines) + "\n"
+
+
+def build_startup_source(sources: list[str], module: str, predicates: dict[str, int], facts: list[str]) -> str:
+    lines = [f":- include({quote(source)})." for source in sources]
+    lines += [f":- dynamic({module}:{pred}/{arity})." for pred, arity in predicates.items()]
+    lines += [f"{module}:{fact.strip()}." for fact in facts]
+    return "\n".join(lines) + "\n"
+
+
+def startup_entry_path(sources: list[str], prolog_version: int) -> str:
+    """Returns the path, without extension, of the precompiled startup file
+    holding `sources` and the facts of the normative types."""
+    # .qlf files are specific to the version of SWI-Prolog that wrote them
+    key = hashlib.sha256(
+        f"{FACTS_VERSION}\0{get_parser_version()}\0{prolog_version}\0".encode()
+        + b"\0".join(file_hash(source).encode() for source in sources)
+    ).hexdigest()
+    return os.path.join(CACHE_DIR, "startup", key)
+
+
+def round_fact_counts(fact_counts: dict[str, int]) -> dict[str, int]:
+    # Counts are rounded to a power of two, so that the checks are only
+    # compiled again when the size of the model changes significantly
+    return {pred: 2 ** round(math.log2(count)) if count else 0 for pred, count in sorted(fact_counts.items())}
+
+
+def cached_checks(checks_path: str, fact_counts: Optional[dict[str, int]] = None) \
+        -> tuple[list[CompiledCheck], str]:
+    """Returns the checks compiled from `checks_path`, and planned for the
+    number of facts in `fact_counts`, together with the Prolog file holding
+    their clauses, compiling them on a cache miss."""
+    with open(checks_path, "rb") as checks_f:
+        checks_src = checks_f.read()
+    if fact_counts is not None:
+        fact_counts = round_fact_counts(fact_counts)
+    key = hashlib.sha256(f"{COMPILER_VERSION}\0{json.dumps(fact_counts)}\0".encode() + checks_src).hexdigest()
+    entry_path = os.path.join(CACHE_DIR, "checks", key)
+
+    try:
+        with open(entry_path + ".json") as meta_f:
+            checks = [CompiledCheck(**check) for check in json.load(meta_f)]
+        # The modification time records when the entry was last used, for
+        # eviction
+        os.utime(entry_path + ".json")
+    except FileNotFoundError:
+        checks = [build_check_pred(check_yaml, fact_counts)
+            for check_yaml in yaml.load(checks_src, Loader=Loader)]
+        # The metadata is written last, as its presence marks the entry
+        # as complete
+        write_atomically(entry_path + ".pl", build_checks_source(checks))
+        write_atomically(entry_path + ".json", json.dumps([check._asdict() for check in checks]))
+        # The .qlf is compiled beside the .pl when the checks are loaded
+        evict_entries(os.path.join(CACHE_DIR, "checks"), entry_path, CHECKS_CACHE_SIZE, [".json", ".pl", ".qlf"])
+    return checks, entry_path + ".pl"
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def resolve_import(imp, base_dir: str) -> tuple[object, Optional[str]]:
+    """Returns the TOSCA import `imp` with the name of the local file it
+    imports resolved from `base_dir`, along with the path of that file, or
+    None if it is imported from a URL or a repository."""
+    # Imports are either plain file names, or definitions with a `file`
+    # key, possibly nested under the name of the import
+    if type(imp) is str:
+        if "://" in imp:
+            return imp, None
+        imp_path = os.path.join(base_dir, imp)
+        return imp_path, imp_path
+    elif type(imp) is dict and "file" not in imp and len(imp) == 1:
+        name, imp_def = list(imp.items())[0]
+        imp_def, imp_path = resolve_import(imp_def, base_dir)
+        return {name: imp_def}, imp_path
+    elif type(imp) is dict and "file" in imp and imp.get("repository") is None:
+        imp_file, imp_path = resolve_import(imp["file"], base_dir)
+        return {**imp, "file": imp_file}, imp_path
+    else:
+        return imp, None
+
+
+def collect_imports(path: str, imports: dict[str, str], tpl_imports: Optional[list] = None) -> bool:
+    """Adds to `imports` the hashes of the files imported, directly or not,
+    by the TOSCA file at `path`, whose imports are `tpl_imports` if already
+    parsed. Returns False if any import cannot be resolved to a local file,
+    in which case changes to it can't be detected."""
+    if tpl_imports is None:
+        with open(path) as tosca_f:
+            tpl = yaml.load(tosca_f, Loader=FastSafeLoader)
+        tpl_imports = (tpl or {}).get("imports") or []
+    for imp in tpl_imports:
+        _, imp_path = resolve_import(imp, os.path.dirname(path))
+        if imp_path is None:
+            return False
+        if imp_path not in imports:
+            imports[imp_path] = file_hash(imp_path)
+            if not collect_imports(imp_path, imports):
+                return False
+    return True
+
+
+def get_parser_version() -> str:
+    try:
+        return metadata.version("tosca-parser")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def facts_entry_path(model_path: str) -> str:
+    # Normative types come from tosca-parser and relative imports are
+    # resolved from the model's directory, so both are part of the key
+    model_path = os.path.abspath(model_path)
+    key = hashlib.sha256(
+        f"{FACTS_VERSION}\0{get_parser_version()}\0{model_path}\0{file_hash(model_path)}".encode()
+    ).hexdigest()
+    return os.path.join(CACHE_DIR, "facts", key)
+
+
+def lookup_facts(model_path: str) -> Optional[tuple[str, dict[str, int]]]:
+    """Returns the Prolog file holding the cached fact base of the model at
+    `model_path` and the line of each of its node templates, or None if
+    there is none or any import has changed."""
+    entry_path = facts_entry_path(model_path)
+    try:
+        with open(entry_path + ".json") as meta_f:
+            meta = json.load(meta_f)
+        if any(file_hash(imp_path) != imp_hash for imp_path, imp_hash in meta["imports"].items()):
+            return None
+    except FileNotFoundError:
+        return None
+    # The modification time records when the entry was last used, for
+    # eviction
+    os.utime(entry_path + ".json")
+    return entry_path + ".pl", meta["node_lines"]
+
+
+def read_facts(facts_pl: str) -> Iterator[str]:
+    # Facts are generated on a single line each
+    with open(facts_pl) as facts_f:
+        for line in facts_f:
+            yield line.rstrip()[:-len(".")]
+
+
+def store_facts(model_path: str, facts: Iterable[str], model_imports: list,
+        node_lines: dict[str, int]) -> Optional[str]:
+    """Caches the fact base of the model at `model_path`, whose template
+    has the imports `model_imports`, along with the line of each of its
+    node templates, so that a cached model is not parsed at all. Returns
+    the Prolog file holding the facts, or None if the model can't be
+    cached, in which case `facts` is left unconsumed."""
+    imports: dict[str, str] = {}
+    if not collect_imports(os.path.abspath(model_path), imports, model_imports):
+        return None
+    entry_path = facts_entry_path(model_path)
+    write_atomically(entry_path + ".pl", (fact.strip() + ".\n" for fact in facts))
+    write_atomically(entry_path + ".json", json.dumps({"imports": imports, "node_lines": node_lines}))
+    evict_facts(keep=entry_path)
+    return entry_path + ".pl"
+
+
+def evict_facts(keep: str):
+    """Removes the least recently used fact bases, but `keep`, until the
+    cache fits in FACTS_CACHE_SIZE."""
+    evict_entries(os.path.join(CACHE_DIR, "facts"), keep, FACTS_CACHE_SIZE, [".json", ".pl"])
+
+
+def evict_entries(entries_dir: str, keep: str, max_size: int, exts: list[str]):
+    """Removes the least recently used entries of `entries_dir`, but
+    `keep`, until their files, with extensions `exts`, fit in `max_size`
+    bytes. Entries are last used when their .json was last modified, and
+    the .json is removed first, as its presence marks them as complete."""
+    entries = []
+    total_size = 0
+    for meta_name in os.listdir(entries_dir):
+        if not meta_name.endswith(".json"):
+            continue
+        entry_path = os.path.join(entries_dir, meta_name[:-len(".json")])
+        try:
+            mtime = os.path.getmtime(entry_path + ".json")
+            # Files not written yet, such as a .qlf, count as empty
+            size = sum(os.path.getsize(entry_path + ext) for ext in exts if os.path.exists(entry_path + ext))
+        except FileNotFoundError:
+            # Evicted by a concurrent run
+            continue
+        entries.append((mtime, size, entry_path))
+        total_size += size
+    for _, size, entry_path in sorted(entries):
+        if total_size <= max_size:
+            break
+        if entry_path == keep:
+            continue
+        for ext in exts:
+            try:
+                os.remove(entry_path + ext)
+            except FileNotFoundError:
+                pass
+        total_size -= size
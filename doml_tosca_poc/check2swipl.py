@@ -1,8 +1,54 @@
 import re
-from typing import Tuple
-import pyswip
+from typing import NamedTuple, Optional
+
+# Bump whenever the Prolog generated for a check changes, so that
+# compiled checks cached on disk are invalidated
+COMPILER_VERSION = 10
 
 var_re = re.compile(r"\$[a-z][A-Za-z0-9_]*")
+control_char_re = re.compile(r"[\x00-\x1f\x7f]")
+quoted_re = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+prolog_var_re = re.compile(r"\b[A-Z_]\w*")
+goal_re = re.compile(r"([a-z]\w*)\((.*)\)")
+
+# Number of facts of each model predicate in a typical model, used to plan
+# the checks when the model is not known
+DEFAULT_FACT_COUNTS = {
+    "node": 100,
+    "node_type": 20,
+    "cap_type": 15,
+    "policy": 5,
+    "node_type_ancestor": 40,
+    "cap_type_ancestor": 30,
+    "node_type_property": 60,
+    "node_type_capability": 50,
+    "node_type_requirement": 30,
+    "cap_type_property": 60,
+    "node_property": 500,
+    "node_capability": 500,
+    "node_capability_property": 400,
+    "node_requirement": 200,
+    "policy_target": 15,
+}
+
+# Estimated number of solutions of the predicates of predicates.pl, and the
+# arguments that must be bound when they are called
+RULES = {
+    "extends_node_type": (lambda counts: counts["node_type"] + counts["node_type_ancestor"], []),
+    "extends_cap_type": (lambda counts: counts["cap_type"] + counts["cap_type_ancestor"], []),
+    "type_offers_capability": (lambda counts: counts["node_type_capability"]
+        * (1 + counts["cap_type_ancestor"] / counts["cap_type"]), []),
+    "type_has_requirement": (lambda counts: counts["node_type_requirement"], []),
+    "requirement_satisfied": (lambda counts: 1, [0, 1]),
+    "subset": (lambda counts: 1, [0, 1]),
+}
+
+# Variable bound to the module of the model in the clauses of the checks,
+# which cannot clash with those of the check, that start with a capital
+MODULE_VAR = "_Module"
+
+# Fraction of the solutions of a goal left by binding one of its arguments
+SELECTIVITY = 0.1
 
 def get_unique_int() -> int:
     get_unique_int.counter += 1
@@ -21,13 +67,20 @@ def is_var(s: str) -> bool:
     return var_re.fullmatch(s) is not None
 
 
+def quote(s: str, delimiter="'") -> str:
+    """Quotes `s` as a Prolog atom, or as a string if `delimiter` is '"'."""
+    s = s.replace("\\", "\\\\").replace(delimiter, "\\" + delimiter)
+    s = control_char_re.sub(lambda m: f"\\x{ord(m.group()):x}\\", s)
+    return delimiter + s + delimiter
+
+
 def atom_or_var(s: str, delimiter="'") -> str:
     if is_var(s):
         return capitalize_first(s[1:])
     elif s == "$_":
         return "_"
     else:
-        return delimiter + s + delimiter
+        return quote(s, delimiter)
 
 
 def get_vars_from_str(s: str) -> dict[str, str]:
@@ -35,14 +88,126 @@ def get_vars_from_str(s: str) -> dict[str, str]:
     return {m: atom_or_var(m) for m in var_re.findall(s)}
 
 
-def build_check_pred(check_yaml) -> Tuple[str, str, dict[str, str], str]:
+class CompiledCheck(NamedTuple):
+    name: str
+    header: str
+    description: str
+    ext_vars: dict[str, str]
+    clause: str
+    # Limits beyond which the check is aborted and reported as inconclusive
+    time_limit: Optional[float] = None
+    inference_limit: Optional[int] = None
+    # Conjuncts of the clause, with the number of solutions estimated for
+    # each of them once the previous ones are bound
+    plan: list[str] = []
+    # Solutions returned: only those binding the external variables to
+    # distinct values, `limit` of them after skipping `offset`, or only the
+    # first one if `exists`
+    distinct: bool = False
+    limit: Optional[int] = None
+    offset: int = 0
+    exists: bool = False
+    # Description with a str.format field in place of each external variable
+    template: str = ""
+    # Whether the check may relate nodes that are not connected, and must
+    # thus run against the whole model rather than against each shard of it
+    is_global: bool = False
+    # Node block of a check that is a plain pattern over the nodes, which
+    # can be evaluated without Prolog, see get_node_pattern
+    pattern: Optional[dict] = None
+
+
+def build_check_pred(check_yaml, fact_counts: Optional[dict[str, int]] = None) -> CompiledCheck:
+    """Compiles a check, ordering its conjuncts according to the number of
+    facts of each model predicate in `fact_counts`, or in a typical model
+    if not given."""
     name = check_yaml["name"]
     description = check_yaml["description"]
     formula = check_yaml["check"]
     ext_vars_dict = get_vars_from_str(description)
     ext_vars = list(ext_vars_dict.values())
     header = f"{name}({', '.join(ext_vars)})"
-    return header, description, ext_vars_dict, f"{header} :- {build_formula_term(formula)}"
+    plan = plan_conjuncts(build_conjuncts(formula), fact_counts or DEFAULT_FACT_COUNTS)
+    # Plain goals would be resolved in `user`, where the checks are
+    # defined, so each goal is called in the module of the model the check
+    # is called in, e.g. as `model_0:check(...)`
+    body = ", ".join([f"context_module({MODULE_VAR})"] + [f"{MODULE_VAR}:({goal})" for goal, _ in plan])
+    return CompiledCheck(name, header, description, ext_vars_dict, f"{header} :- {body}",
+        check_yaml.get("time_limit"), check_yaml.get("inference_limit"),
+        [f"{rows:12.2f}  {goal}" for goal, rows in plan],
+        check_yaml.get("distinct", False), check_yaml.get("limit"), check_yaml.get("offset", 0),
+        check_yaml.get("exists", False), build_template(description), check_yaml.get("global", False),
+        get_node_pattern(check_yaml))
+
+
+def is_literal(value) -> bool:
+    return (type(value) is str and not value.startswith("$")) or type(value) in [int, float]
+
+
+def is_pattern_value(value) -> bool:
+    return value == "$_" or (type(value) is str and is_var(value)) or is_literal(value)
+
+
+def is_pattern_props(props) -> bool:
+    return type(props) is dict \
+        and all(is_literal(pname) and type(pname) is str and is_pattern_value(pval) for pname, pval in props.items())
+
+
+def get_node_pattern(check_yaml) -> Optional[dict]:
+    """Returns the node block of a check made of that block only, matching
+    the type, properties and capability properties of a node against
+    literal values or variables, or None if the check is any other
+    formula. Such checks can be evaluated directly on the facts of the
+    nodes. Checks whose results depend on the order solutions are found in
+    are left to Prolog."""
+    if check_yaml.get("limit") is not None or check_yaml.get("offset") or check_yaml.get("exists"):
+        return None
+    formula = check_yaml["check"]
+    if type(formula) is dict and list(formula) == ["and"] and type(formula["and"]) is list \
+            and len(formula["and"]) == 1:
+        formula = formula["and"][0]
+    if type(formula) is not dict or list(formula) != ["node"]:
+        return None
+    block = formula["node"]
+    if type(block) is not dict or len(block) != 1:
+        return None
+    root, node = list(block.items())[0]
+    if not is_pattern_value(root) or type(root) is not str or type(node) is not dict \
+            or not set(node) <= {"type", "properties", "capabilities"} \
+            or (type(node.get("type", "")) is not str or not is_pattern_value(node.get("type", "$_"))) \
+            or not is_pattern_props(node.get("properties", {})):
+        return None
+    caps = node.get("capabilities", {})
+    if type(caps) is not dict or not all(
+            type(cname) is str and is_pattern_value(cname) and type(cdict) is dict and list(cdict) == ["properties"]
+                and is_pattern_props(cdict["properties"])
+            for cname, cdict in caps.items()):
+        return None
+    # Every variable of the description must be bound by the pattern
+    if not set(get_vars_from_str(check_yaml["description"])) <= set(var_re.findall(str(block))):
+        return None
+    return block
+
+
+def build_template(description: str) -> str:
+    # Formatting a result is then a single str.format call
+    escaped = description.replace("{", "{{").replace("}", "}}")
+    return var_re.sub(lambda m: "{" + m.group() + "}", escaped)
+
+
+def build_check_goal(check: CompiledCheck, goal: str) -> str:
+    """Wraps `goal`, which proves the clause of `check`, so that it only
+    yields the solutions selected by the result modes of the check, and
+    stops as soon as they are found."""
+    if check.distinct:
+        goal = f"distinct([{', '.join(check.ext_vars.values())}], {goal})"
+    if check.offset:
+        goal = f"offset({check.offset}, {goal})"
+    if check.limit is not None:
+        goal = f"limit({check.limit}, {goal})"
+    if check.exists:
+        goal = f"once({goal})"
+    return goal
 
 
 def build_term(term) -> str:
@@ -63,7 +228,7 @@ def build_term(term) -> str:
         return str(term)
 
 
-def build_node_pred(node) -> str:
+def build_node_pred(node) -> list[str]:
     node_struct_err = """Node must have structure:
     <node name>:
         [type: <node type>]
@@ -77,62 +242,69 @@ def build_node_pred(node) -> str:
     assert type(node[root]) is dict, node_struct_err
     node_type = atom_or_var(node[root].get("type", "$_"))
     node_int = get_unique_int()
+    if node_name == "_":
+        # All the relations below must refer to the same node
+        node_name = f"Node{node_int}"
 
-    def build_props_list(props_dict) -> list[str]:
+    def build_props_args(props_dict) -> list[str]:
         res = []
         for pname, pval in props_dict.items():
             pname = atom_or_var(pname)
             if type(pval) is str:
                 pval = atom_or_var(pval, delimiter='"')
-            res.append(f"property({pname}, {pval})")
+            res.append(f"{pname}, {pval}")
         return res
 
-    props_list = []
+    # Patterns are matched against the flat node_* relations rather than
+    # against the lists in node/5, so that lookups can use argument indexing
+    rel_preds = []
     props_var = "_"
     if "properties" in node[root]:
         if type(node[root]["properties"]) is str and is_var(node[root]["properties"]):
             props_var = atom_or_var(node[root]["properties"])
         else:
-            props_var = f"Props{node_int}"
-            props_list = build_props_list(node[root]["properties"])
+            rel_preds.extend(f"node_property({node_name}, {prop})"
+                for prop in build_props_args(node[root]["properties"]))
     
-    caps_list = []
     caps_var = "_"
     if "capabilities" in node[root]:
         if type(node[root]["capabilities"]) is str and is_var(node[root]["capabilities"]):
             caps_var = atom_or_var(node[root]["capabilities"])
         else:
-            caps_var = f"Caps{node_int}"
-            for cname, cdict in node[root]["capabilities"].items():
+            for i, (cname, cdict) in enumerate(node[root]["capabilities"].items()):
                 cname = atom_or_var(cname)
+                if cname == "_":
+                    # The properties must belong to the same capability
+                    cname = f"Cap{node_int}_{i}"
                 assert "properties" in cdict, "Capabilities in node should contain properties"
-                cprops_list = build_props_list(cdict["properties"])
-                caps_list.append(f"capability({cname}, [{', '.join(cprops_list)}])")
+                cprops = build_props_args(cdict["properties"])
+                if cprops:
+                    rel_preds.extend(f"node_capability_property({node_name}, {cname}, {cprop})"
+                        for cprop in cprops)
+                else:
+                    rel_preds.append(f"node_capability({node_name}, {cname})")
 
-    reqs_list = []
     reqs_var = "_"
     if "requirements" in node[root]:
         if type(node[root]["requirements"]) is str and is_var(node[root]["requirements"]):
             reqs_var = atom_or_var(node[root]["requirements"])
         else:
-            reqs_var = f"Reqs{node_int}"
             for req in node[root]["requirements"]:
                 rname, rval = list(req.items())[0]
                 rname = atom_or_var(rname)
                 rval = atom_or_var(rval)
-                reqs_list.append(f"requirement({rname}, {rval})")
+                rel_preds.append(f"node_requirement({node_name}, {rname}, {rval})")
 
-    preds = [f"node({node_name}, {node_type}, {props_var}, {caps_var}, {reqs_var})"]
-    if props_list:
-        preds.append(f"subset([{', '.join(props_list)}], {props_var})")
-    if caps_list:
-        preds.append(f"subset([{', '.join(caps_list)}], {caps_var})")
-    if reqs_list:
-        preds.append(f"subset([{', '.join(reqs_list)}], {reqs_var})")
-    return ", ".join(preds)
+    # node/5 is only needed to match the type or whole lists, or to bind
+    # the node when there are no relations to do it
+    preds = []
+    if not rel_preds or [node_type, props_var, caps_var, reqs_var] != ["_"] * 4:
+        preds.append(f"node({node_name}, {node_type}, {props_var}, {caps_var}, {reqs_var})")
+    preds.extend(rel_preds)
+    return preds
 
 
-def build_typedef_props_list(props_dict) -> list[str]:
+def build_typedef_props_args(props_dict) -> list[str]:
     res = []
     for pname, pdict in props_dict.items():
         requiredness = "_"
@@ -140,11 +312,11 @@ def build_typedef_props_list(props_dict) -> list[str]:
             requiredness = "true" if pdict["required"] else "false"
         pname = atom_or_var(pname)
         ptype = atom_or_var(pdict.get("type", "$_"))
-        res.append(f"property({pname}, {ptype}, {requiredness})")
+        res.append(f"{pname}, {ptype}, {requiredness}")
     return res
 
 
-def build_node_type_pred(node_type) -> str:
+def build_node_type_pred(node_type) -> list[str]:
     node_type_struct_err = """Node type must have structure:
     <node type name>:
         [derived_from: <node type>]
@@ -158,37 +330,36 @@ def build_node_type_pred(node_type) -> str:
     assert type(node_type[root]) is dict, node_type_struct_err
     derived_from = atom_or_var(node_type[root].get("derived_from", "$_"))
     type_int = get_unique_int()
+    if type_name == "_":
+        # All the relations below must refer to the same type
+        type_name = f"Type{type_int}"
 
-    props_list = []
+    rel_preds = []
     props_var = "_"
     if "properties" in node_type[root]:
         if type(node_type[root]["properties"]) is str and is_var(node_type[root]["properties"]):
             props_var = atom_or_var(node_type[root]["properties"])
         else:
-            props_var = f"Props{type_int}"
-            props_list = build_typedef_props_list(node_type[root]["properties"])
+            rel_preds.extend(f"node_type_property({type_name}, {prop})"
+                for prop in build_typedef_props_args(node_type[root]["properties"]))
     
-    caps_list = []
     caps_var = "_"
     if "capabilities" in node_type[root]:
         if type(node_type[root]["capabilities"]) is str and is_var(node_type[root]["capabilities"]):
             caps_var = atom_or_var(node_type[root]["capabilities"])
         else:
-            caps_var = f"Caps{type_int}"
             for cname, cdict in node_type[root]["capabilities"].items():
                 assert list(cdict) == ["type"], \
                     "Capability in node type must have exactly one key: 'type'."
                 cname = atom_or_var(cname)
                 ctype = atom_or_var(cdict["type"])
-                caps_list.append(f"capability({cname}, {ctype})")
+                rel_preds.append(f"node_type_capability({type_name}, {cname}, {ctype})")
 
-    reqs_list = []
     reqs_var = "_"
     if "requirements" in node_type[root]:
         if type(node_type[root]["requirements"]) is str and is_var(node_type[root]["requirements"]):
             reqs_var = atom_or_var(node_type[root]["requirements"])
         else:
-            reqs_var = f"Reqs{type_int}"
             for req in node_type[root]["requirements"]:
                 rname, rdict = list(req.items())[0]
                 rname = atom_or_var(rname)
@@ -210,18 +381,17 @@ def build_node_type_pred(node_type) -> str:
                     elif occ_ub == "UNBOUNDED":
                         occ_ub = "unbounded"
                     req_occ = f"occurrences({occ_lb}, {occ_ub})"
-                reqs_list.append(f"requirement({rname}, {req_cap}, {req_node}, {req_rel}, {req_occ})")
-    preds = [f"node_type({type_name}, {derived_from}, {props_var}, {caps_var}, {reqs_var})"]
-    if props_list:
-        preds.append(f"subset([{', '.join(props_list)}], {props_var})")
-    if caps_list:
-        preds.append(f"subset([{', '.join(caps_list)}], {caps_var})")
-    if reqs_list:
-        preds.append(f"subset([{', '.join(reqs_list)}], {reqs_var})")
-    return ", ".join(preds)
-
-
-def build_cap_type_pred(cap_type) -> str:
+                rel_preds.append(
+                    f"node_type_requirement({type_name}, {rname}, {req_cap}, {req_node}, {req_rel}, {req_occ})")
+
+    preds = []
+    if not rel_preds or [derived_from, props_var, caps_var, reqs_var] != ["_"] * 4:
+        preds.append(f"node_type({type_name}, {derived_from}, {props_var}, {caps_var}, {reqs_var})")
+    preds.extend(rel_preds)
+    return preds
+
+
+def build_cap_type_pred(cap_type) -> list[str]:
     cap_type_struct_err = """capability type must have structure:
     <capability type name>:
         [derived_from: <capability type>]
@@ -233,23 +403,27 @@ def build_cap_type_pred(cap_type) -> str:
     assert type(cap_type[root]) is dict, cap_type_struct_err
     derived_from = atom_or_var(cap_type[root].get("derived_from", "$_"))
     type_int = get_unique_int()
+    if type_name == "_":
+        # All the relations below must refer to the same type
+        type_name = f"Type{type_int}"
 
-    props_list = []
+    rel_preds = []
     props_var = "_"
     if "properties" in cap_type[root]:
         if type(cap_type[root]["properties"]) is str and is_var(cap_type[root]["properties"]):
             props_var = atom_or_var(cap_type[root]["properties"])
         else:
-            props_var = f"Props{type_int}"
-            props_list = build_typedef_props_list(cap_type[root]["properties"])
+            rel_preds.extend(f"cap_type_property({type_name}, {prop})"
+                for prop in build_typedef_props_args(cap_type[root]["properties"]))
 
-    preds = [f"cap_type({type_name}, {derived_from}, {props_var})"]
-    if props_list:
-        preds.append(f"subset([{', '.join(props_list)}], {props_var})")
-    return ", ".join(preds)
+    preds = []
+    if not rel_preds or [derived_from, props_var] != ["_"] * 2:
+        preds.append(f"cap_type({type_name}, {derived_from}, {props_var})")
+    preds.extend(rel_preds)
+    return preds
 
 
-def build_policy_pred(pol) -> str:
+def build_policy_pred(pol) -> list[str]:
     pol_struct_err = """Node must have structure:
     <policy name>:
         [type: <policy type>]
@@ -261,20 +435,23 @@ def build_policy_pred(pol) -> str:
     assert type(pol[root]) is dict, pol_struct_err
     pol_type = atom_or_var(pol[root].get("type", "$_"))
     pol_int = get_unique_int()
+    if pol_name == "_":
+        # All the relations below must refer to the same policy
+        pol_name = f"Pol{pol_int}"
 
-    tgts_list = []
+    rel_preds = []
     tgts_var = "_"
     if "targets" in pol[root]:
         if type(pol[root]["targets"]) is str and is_var(pol[root]["targets"]):
             tgts_var = atom_or_var(pol[root]["targets"])
         else:
-            tgts_var = f"Tgts{pol_int}"
-            tgts_list = [atom_or_var(t) for t in pol[root]["targets"]]
+            rel_preds.extend(f"policy_target({pol_name}, {atom_or_var(t)})" for t in pol[root]["targets"])
 
-    preds = [f"policy({pol_name}, {pol_type}, {tgts_var})"]
-    if tgts_list:
-        preds.append(f"subset([{', '.join(tgts_list)}], {tgts_var})")
-    return ", ".join(preds)
+    preds = []
+    if not rel_preds or [pol_type, tgts_var] != ["_"] * 2:
+        preds.append(f"policy({pol_name}, {pol_type}, {tgts_var})")
+    preds.extend(rel_preds)
+    return preds
 
 
 def build_formula_term(formula) -> str:
@@ -296,6 +473,27 @@ def build_formula_term(formula) -> str:
     elif root == "predicate":
         assert type(op_s) is dict and len(op_s) == 1, "'predicate' requires a single dict term"
         return build_term(op_s)
+    elif root == "node":
+        return ", ".join(build_node_pred(op_s))
+    elif root == "node_type":
+        return ", ".join(build_node_type_pred(op_s))
+    elif root == "capability_type":
+        return ", ".join(build_cap_type_pred(op_s))
+    elif root == "policy":
+        return ", ".join(build_policy_pred(op_s))
+    else:
+        return "unsupported"
+
+
+def build_conjuncts(formula) -> list[str]:
+    """Splits `formula` into the goals of its top-level conjunction."""
+    assert type(formula) is dict and len(formula) == 1, \
+        "Every formula must be a dictionary with one key"
+    root = list(formula)[0]
+    op_s = formula[root]
+    if root == "and":
+        assert type(op_s) is list, "'and' connective requires a list of formulas"
+        return [goal for op in op_s for goal in build_conjuncts(op)]
     elif root == "node":
         return build_node_pred(op_s)
     elif root == "node_type":
@@ -305,15 +503,130 @@ def build_formula_term(formula) -> str:
     elif root == "policy":
         return build_policy_pred(op_s)
     else:
-        return "unsupported"
+        return [build_formula_term(formula)]
+
+
+class Conjunct(NamedTuple):
+    goal: str
+    # Predicate called by the goal, if it is a plain call
+    name: Optional[str]
+    # Variables of each argument, or None for `_`
+    args: list[Optional[set[str]]]
+    vars: set[str]
+    # Goals such as `\+`, disjunctions and unknown predicates, whose
+    # meaning may depend on which of their variables are bound
+    opaque: bool
+
+
+def get_prolog_vars(s: str) -> set[str]:
+    return set(prolog_var_re.findall(quoted_re.sub("''", s))) - {"_"}
+
+
+def split_args(s: str) -> Optional[list[str]]:
+    # Splits at the top-level commas, or returns None if the parentheses
+    # of `s` are unbalanced
+    args = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(s):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif c == "," and depth == 0:
+            args.append(s[start:i].strip())
+            start = i + 1
+    args.append(s[start:].strip())
+    return args if depth == 0 else None
+
+
+def is_unification(goal: str) -> bool:
+    # The first ` = ` of a unification is outside of any term
+    lhs, sep, _ = goal.partition(" = ")
+    return sep != "" and split_args(lhs) == [lhs.strip()]
+
+
+def analyze_goal(goal: str, fact_counts: dict[str, int]) -> Conjunct:
+    unquoted = quoted_re.sub("''", goal)
+    goal_vars = get_prolog_vars(goal)
+    m = goal_re.fullmatch(unquoted)
+    args = split_args(m.group(2)) if m else None
+    if m and args is not None and (m.group(1) in fact_counts or m.group(1) in RULES):
+        return Conjunct(goal, m.group(1), [None if arg == "_" else get_prolog_vars(arg) for arg in args],
+            goal_vars, False)
+    elif is_unification(unquoted):
+        # Unification is pure, so it can be moved freely
+        return Conjunct(goal, None, [], goal_vars, False)
+    else:
+        return Conjunct(goal, None, [], goal_vars, True)
+
 
+def get_key_entity(name: str) -> Optional[str]:
+    # The first argument of the model predicates names the entity they
+    # describe
+    for entity in ["node_type", "cap_type", "node", "policy"]:
+        if name == entity or name.startswith(entity + "_"):
+            return entity
+    return None
 
-def fmt_result(res) -> str:
-    if type(res) is pyswip.Atom:
-        return res.value
-    elif type(res) is list:
-        return "[" + ", ".join([fmt_result(r) for r in res]) + "]"
-    elif type(res) is bytes:
-        return res.decode('UTF-8')
+
+def estimate_rows(conj: Conjunct, bound: set[str], fact_counts: dict[str, int]) -> float:
+    if conj.name is None:
+        return 1
+    elif conj.name in RULES:
+        rows = RULES[conj.name][0](fact_counts)
+        key_entity = None
     else:
-        return str(res)
\ No newline at end of file
+        rows = fact_counts[conj.name]
+        key_entity = get_key_entity(conj.name)
+    for i, arg_vars in enumerate(conj.args):
+        if arg_vars is None or not arg_vars <= bound:
+            continue
+        if i == 0 and key_entity is not None:
+            rows /= fact_counts[key_entity]
+        else:
+            rows *= SELECTIVITY
+    return rows
+
+
+def plan_conjuncts(goals: list[str], fact_counts: dict[str, int]) -> list[tuple[str, float]]:
+    """Orders `goals` greedily, picking each time the goal with the fewest
+    estimated solutions given the variables bound by the goals before it.
+    Opaque goals keep the variables bound and unbound they had in the
+    original order. Returns each goal with its estimate."""
+    # No predicate is assumed to be empty, to keep the estimates meaningful
+    fact_counts = {pred: max(count, 1) for pred, count in {**DEFAULT_FACT_COUNTS, **fact_counts}.items()}
+    conjuncts = [analyze_goal(goal, fact_counts) for goal in goals]
+    # Variables of the goals written before each goal
+    earlier_vars = []
+    seen: set[str] = set()
+    for conj in conjuncts:
+        earlier_vars.append(set(seen))
+        seen |= conj.vars
+
+    def can_run(i: int, bound: set[str], pending: list[int]) -> bool:
+        conj = conjuncts[i]
+        if conj.opaque and not conj.vars & earlier_vars[i] <= bound:
+            return False
+        if conj.name in RULES and any(conj.args[j] is None or not conj.args[j] <= bound  # type: ignore
+                for j in RULES[conj.name][1]):
+            return False
+        # Variables must not be bound before the opaque goals that saw
+        # them unbound
+        return not any(j != i and conjuncts[j].opaque and conj.vars & conjuncts[j].vars - earlier_vars[j] - bound
+            for j in pending)
+
+    plan = []
+    bound: set[str] = set()
+    pending = list(range(len(conjuncts)))
+    while pending:
+        candidates = [(estimate_rows(conjuncts[i], bound, fact_counts), i)
+            for i in pending if can_run(i, bound, pending)]
+        # The first pending goal can always run in the original order
+        rows, i = min(candidates) if candidates else (estimate_rows(conjuncts[pending[0]], bound, fact_counts), pending[0])
+        pending.remove(i)
+        bound |= conjuncts[i].vars
+        plan.append((conjuncts[i].goal, rows))
+    return plan
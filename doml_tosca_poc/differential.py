@@ -0,0 +1,80 @@
+"""Differential check of the evaluation of pattern checks without Prolog.
+
+Runs the pattern checks of a checks file on the index of `native.py` and
+with Prolog, against `doml_tosca.yaml` and a model generated by
+`bench.generate_model`, and prints the results found by one engine only.
+The exit status is 1 if the engines disagree on any check:
+
+    python differential.py --checks pattern_checks.yaml
+
+The checks are planned for each model, and compiled for it into a checks
+file of its own, so each model is verified by a Prolog of its own, in a
+process of its own. The caches of facts and checks are kept in a
+temporary directory, rather than in that of the user.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+import cache
+from bench import generate_model
+from native import NodeIndex, print_differences, run_native_check
+from poc import get_fact_counts, init_prolog, load_checks, load_model_facts, run_check
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "doml_tosca.yaml")
+
+
+def compare_engines(model_path: str, checks_path: str, cache_dir: str) -> tuple[int, bool]:
+    """Runs the pattern checks of `checks_path` with both engines against
+    the model at `model_path`, keeping the caches in `cache_dir`. Returns
+    the number of pattern checks, and whether the engines found different
+    results for any of them."""
+    cache.CACHE_DIR = cache_dir
+    prolog = init_prolog()
+    index = NodeIndex()
+    load_model_facts(prolog, model_path, index=index)
+    checks = [check for check in load_checks(prolog, checks_path, get_fact_counts(prolog))
+        if check.pattern is not None]
+    differences = False
+    for check in checks:
+        prolog_stats: dict = {}
+        prolog_results = list(run_check(prolog, check, stats=prolog_stats))
+        if prolog_stats["status"] == "inconclusive":
+            print(f"{check.name}: inconclusive with Prolog: {prolog_stats['reason']}", file=sys.stderr)
+            differences = True
+        elif print_differences(check, run_native_check(index, check), prolog_results):
+            differences = True
+    return len(checks), differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the results of the pattern checks with and without Prolog.")
+    parser.add_argument("--checks", default="pattern_checks.yaml", help="checks file (default: %(default)s)")
+    parser.add_argument("--nodes", type=int, default=100,
+        help="number of node templates of the generated model (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    differences = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        generated_path = os.path.join(work_dir, "model.yaml")
+        with open(generated_path, "w") as model_f:
+            yaml.safe_dump(generate_model(nodes=args.nodes, seed=args.seed), model_f, sort_keys=False)
+        for model_path in [MODEL_PATH, generated_path]:
+            # Processes are spawned rather than forked, as an SWI-Prolog
+            # engine does not survive a fork
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                count, model_differences = executor.submit(
+                    compare_engines, model_path, args.checks, os.path.join(work_dir, "cache")).result()
+            if count == 0:
+                parser.error(f"{args.checks} has no pattern checks")
+            print(f"{model_path}: {count} pattern checks, "
+                f"{'results differ' if model_differences else 'same results'}")
+            differences = differences or model_differences
+    if differences:
+        sys.exit(1)
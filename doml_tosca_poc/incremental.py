@@ -0,0 +1,67 @@
+"""Incremental re-verification of successive versions of a model.
+
+Only the facts that differ from the previously loaded version are
+retracted and asserted, and only the checks that depend, directly or
+through `predicates.pl`, on the predicates of those facts are run again.
+"""
+from pyswip import Prolog
+
+from check2swipl import CompiledCheck
+from poc import MODEL_PREDICATES, assert_facts, declare_model_predicates, fmt_result, retract_facts, run_check
+from tosca2swipl import get_functor
+
+
+class IncrementalVerifier:
+    def __init__(self, prolog: Prolog, checks: list[CompiledCheck], module: str = "user"):
+        self.prolog = prolog
+        self.checks = checks
+        self.module = module
+        self.facts: set[str] = set()
+        # Results of the last run of each check
+        self.results: dict[str, set[tuple[str, ...]]] = {}
+        self.dependencies = {check.name: self.get_dependencies(check) for check in checks}
+        declare_model_predicates(prolog, module)
+
+    def get_dependencies(self, check: CompiledCheck) -> set[str]:
+        res = next(self.prolog.query(
+            f"called_predicates({check.header}, Preds), findall(Name, member(Name/_, Preds), Names)"))
+        return {fmt_result(name) for name in res["Names"]} & set(MODEL_PREDICATES) # type: ignore
+
+    def update(self, facts: list[str]) -> dict[str, dict]:
+        """Replaces the facts of the model with `facts`. Returns, for each
+        check that was run again, the results that appeared ("new") and
+        disappeared ("resolved") since the previous update, or the reason
+        why the check is "inconclusive"."""
+        new_facts = set(facts)
+        removed = self.facts - new_facts
+        added = new_facts - self.facts
+        if removed:
+            retract_facts(self.prolog, self.module, list(removed))
+        if added:
+            assert_facts(self.prolog, list(added), self.module)
+        self.facts = new_facts
+
+        changed_preds = {get_functor(fact) for fact in removed | added}
+        delta = {}
+        for check in self.checks:
+            if check.name in self.results and not self.dependencies[check.name] & changed_preds:
+                continue
+            stats: dict = {}
+            results = {tuple(res.values()) for res in run_check(self.prolog, check, self.module, stats)}
+            if stats["status"] == "inconclusive":
+                # The results are incomplete, so the check is compared
+                # afresh on the next update
+                self.results.pop(check.name, None)
+                delta[check.name] = {"inconclusive": stats["reason"]}
+                continue
+            previous = self.results.get(check.name, set())
+            self.results[check.name] = results
+            ext_vars = list(check.ext_vars)
+            delta[check.name] = {
+                "new": [dict(zip(ext_vars, res)) for res in sorted(results - previous)],
+                "resolved": [dict(zip(ext_vars, res)) for res in sorted(previous - results)]
+            }
+        return delta
+
+    def close(self):
+        retract_facts(self.prolog, self.module)
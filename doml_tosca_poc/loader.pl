@@ -0,0 +1,86 @@
+% load_facts(+File, +Module)
+%
+% Asserts every term of File as a fact of Module. Unlike consulting, this
+% keeps the facts dynamic, so that they can be retracted once a model has
+% been verified.
+load_facts(File, Module) :-
+    setup_call_cleanup(
+        open(File, read, Stream),
+        read_facts(Stream, Module),
+        close(Stream)).
+
+read_facts(Stream, Module) :-
+    read_term(Stream, Term, []),
+    (   Term == end_of_file
+    ->  true
+    ;   assertz(Module:Term),
+        read_facts(Stream, Module)
+    ).
+
+% called_predicates(:Goal, -Preds)
+%
+% Preds is the list of Name/Arity of the predicates called, directly or
+% through other predicates, by Goal. The clauses of dynamic predicates,
+% i.e. the model facts, are not walked.
+called_predicates(Goal, Preds) :-
+    called_predicates([Goal], [], Preds).
+
+called_predicates([], Preds, Preds).
+called_predicates([Goal|Goals], Seen, Preds) :-
+    (   var(Goal)
+    ->  called_predicates(Goals, Seen, Preds)
+    ;   control_subgoals(Goal, Subgoals)
+    ->  append(Subgoals, Goals, Goals1),
+        called_predicates(Goals1, Seen, Preds)
+    ;   functor(Goal, Name, Arity),
+        memberchk(Name/Arity, Seen)
+    ->  called_predicates(Goals, Seen, Preds)
+    ;   functor(Goal, Name, Arity),
+        (   predicate_property(Goal, dynamic)
+        ->  Bodies = []
+        ;   findall(Body, catch(clause(Goal, Body), _, fail), Bodies)
+        ),
+        append(Bodies, Goals, Goals1),
+        called_predicates(Goals1, [Name/Arity|Seen], Preds)
+    ).
+
+control_subgoals((A, B), [A, B]).
+control_subgoals((A ; B), [A, B]).
+control_subgoals((A -> B), [A, B]).
+control_subgoals(\+ A, [A]).
+control_subgoals(_:A, [A]).
+control_subgoals(call(A), [A]).
+control_subgoals(once(A), [A]).
+control_subgoals(ignore(A), [A]).
+control_subgoals(forall(A, B), [A, B]).
+control_subgoals(findall(_, A, _), [A]).
+control_subgoals(aggregate_all(_, A, _), [A]).
+
+% assert_facts(+Module, +Facts)
+% retract_facts(+Module, +Facts)
+%
+% Assert or retract a whole list of facts of Module at once, so that a
+% fact base is loaded through a single query instead of one per fact.
+assert_facts(Module, Facts) :-
+    forall(member(Fact, Facts), assertz(Module:Fact)).
+
+retract_facts(Module, Facts) :-
+    forall(member(Fact, Facts), ignore(retract(Module:Fact))).
+
+% link_normative_types(+Module, +Preds)
+%
+% Makes the facts of the normative types, loaded once into the
+% normative_types module, visible from each type predicate Name/Arity of
+% Preds in Module, through a clause calling their definition there. Model
+% facts being the only other clauses, a predicate with a rule is already
+% linked.
+link_normative_types(normative_types, _) :- !.
+link_normative_types(Module, Preds) :-
+    forall(
+        (   member(Name/Arity, Preds),
+            functor(Head, Name, Arity),
+            \+ (   predicate_property(Module:Head, number_of_rules(Rules)),
+                   Rules > 0
+               )
+        ),
+        assertz(Module:(Head :- normative_types:Head))).
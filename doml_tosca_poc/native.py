@@ -0,0 +1,227 @@
+"""Evaluation of pattern checks without Prolog.
+
+Checks that only match a node block against literal values and variables
+(see `check2swipl.get_node_pattern`) are evaluated on an index of the node
+facts, by type and by property name and value, rather than queried from
+Prolog. Values are compared through the Prolog text generated for them,
+which is equal exactly when the terms unify, and bindings are written as
+Prolog writes them, so that both engines return the same results.
+"""
+import re
+import sys
+import time
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+
+from check2swipl import CompiledCheck, is_var, quote, quoted_re
+from tosca2swipl import get_functor
+
+escape_re = re.compile(r"\\x([0-9a-f]+)\\|\\(.)")
+number_re = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?")
+
+
+def split_fact(fact: str, atoms: int) -> tuple[list[str], str]:
+    # The first `atoms` arguments of the node facts are quoted atoms, the
+    # rest is a single value
+    args = []
+    pos = fact.index("(") + 1
+    for _ in range(atoms):
+        m = quoted_re.match(fact, pos)
+        args.append(m.group()) # type: ignore
+        pos = m.end() + len(", ") # type: ignore
+    return args, fact[pos:-1]
+
+
+def unquote(text: str) -> str:
+    return escape_re.sub(lambda m: chr(int(m.group(1), 16)) if m.group(1) else m.group(2), text[1:-1])
+
+
+def format_float(text: str) -> str:
+    # Prolog writes floats in their shortest form, always with a fraction
+    # and without the sign and leading zeros of the exponent
+    mantissa, _, exponent = repr(float(text)).partition("e")
+    if "." not in mantissa:
+        mantissa += ".0"
+    return f"{mantissa}e{int(exponent)}" if exponent else mantissa
+
+
+def format_value(text: str) -> str:
+    """Formats the Prolog text of a generated value as `poc.fmt_result` formats
+    the term Prolog reads from it."""
+    if text[0] in "'\"":
+        return unquote(text)
+    elif text.startswith("get_input("):
+        return f"get_input({unquote(text[len('get_input('):-1])})"
+    elif number_re.fullmatch(text) and not text.lstrip("-").isdigit():
+        return format_float(text)
+    else:
+        return text
+
+
+def pattern_text(value, delimiter="'") -> Optional[str]:
+    # The Prolog text check2swipl generates for a literal, or None for a
+    # variable
+    if value == "$_" or (type(value) is str and is_var(value)):
+        return None
+    return quote(value, delimiter) if type(value) is str else str(value)
+
+
+class NodeIndex:
+    """Node facts of a model, by node, type and property value. Names and
+    values are kept as their Prolog text."""
+
+    def __init__(self, facts: Iterable[str] = ()):
+        self.nodes: list[str] = []
+        self.types: dict[str, str] = {}
+        self.by_type: dict[str, list[str]] = {}
+        self.properties: dict[str, dict[str, str]] = {}
+        self.by_property: dict[tuple[str, str], list[str]] = {}
+        self.capabilities: dict[str, dict[str, dict[str, str]]] = {}
+        self.extend(facts)
+
+    def add(self, fact: str):
+        functor = get_functor(fact)
+        if functor == "node":
+            (node, node_type), _ = split_fact(fact, 2)
+            self.nodes.append(node)
+            self.types[node] = node_type
+            self.by_type.setdefault(node_type, []).append(node)
+        elif functor == "node_property":
+            (node, pname), value = split_fact(fact, 2)
+            self.properties.setdefault(node, {})[pname] = value
+            self.by_property.setdefault((pname, value), []).append(node)
+        elif functor == "node_capability":
+            (node, cname), _ = split_fact(fact, 2)
+            self.capabilities.setdefault(node, {}).setdefault(cname, {})
+        elif functor == "node_capability_property":
+            (node, cname, pname), value = split_fact(fact, 3)
+            self.capabilities.setdefault(node, {}).setdefault(cname, {})[pname] = value
+
+    def extend(self, facts: Iterable[str]):
+        for fact in facts:
+            self.add(fact)
+
+    def indexed(self, facts: Iterable[str]) -> Iterator[str]:
+        # Passes `facts` through, indexing them on the way, so that facts
+        # generated for Prolog are indexed without being generated again
+        for fact in facts:
+            self.add(fact)
+            yield fact
+
+    def candidates(self, pattern: dict) -> list[str]:
+        # The nodes of the most selective of the type and literal
+        # properties of the pattern, in the order of their facts
+        node = list(pattern.values())[0]
+        lists = [self.nodes]
+        if pattern_text(node.get("type", "$_")) is not None:
+            lists.append(self.by_type.get(pattern_text(node["type"]), [])) # type: ignore
+        for pname, pval in (node.get("properties") or {}).items():
+            text = pattern_text(pval, delimiter='"')
+            if text is not None:
+                lists.append(self.by_property.get((quote(pname), text), []))
+        return min(lists, key=len)
+
+
+def unify(bindings: dict[str, str], value, text: str) -> Optional[dict[str, str]]:
+    """Returns `bindings` extended so that the pattern `value` matches the
+    Prolog text `text`, or None if it can't."""
+    if value == "$_":
+        return bindings
+    elif type(value) is str and is_var(value):
+        if value in bindings:
+            return bindings if bindings[value] == text else None
+        return {**bindings, value: text}
+    else:
+        return bindings if text == pattern_text(value, delimiter='"' if type(value) is str else "'") else None
+
+
+def unify_props(bindings: Optional[dict[str, str]], props: dict, values: dict[str, str]) -> Optional[dict[str, str]]:
+    for pname, pval in props.items():
+        if bindings is None or quote(pname) not in values:
+            return None
+        bindings = unify(bindings, pval, values[quote(pname)])
+    return bindings
+
+
+def match_caps(bindings: dict[str, str], caps: list[tuple[str, dict]],
+        node_caps: dict[str, dict[str, str]]) -> Iterator[dict[str, str]]:
+    # Each capability of the pattern is matched against every capability
+    # of the node, as the node_capability* goals of its clause would
+    if not caps:
+        yield bindings
+        return
+    (cname, props), rest = caps[0], caps[1:]
+    for node_cname, values in node_caps.items():
+        # Capabilities are named by atoms, unlike property values
+        if pattern_text(cname) is not None and quote(cname) != node_cname:
+            continue
+        cap_bindings = bindings if pattern_text(cname) is not None else unify(bindings, cname, node_cname)
+        if props:
+            cap_bindings = unify_props(cap_bindings, props, values)
+        if cap_bindings is not None:
+            yield from match_caps(cap_bindings, rest, node_caps)
+
+
+def match_pattern(index: NodeIndex, pattern: dict) -> Iterator[dict[str, str]]:
+    """Yields the bindings of the variables of `pattern` for each of its
+    solutions among the nodes of `index`."""
+    root, node = list(pattern.items())[0]
+    caps = [(cname, cdict["properties"]) for cname, cdict in (node.get("capabilities") or {}).items()]
+    for node_name in index.candidates(pattern):
+        if pattern_text(root) is not None and quote(root) != node_name:
+            continue
+        bindings: Optional[dict[str, str]] = {} if pattern_text(root) is not None \
+            else unify({}, root, node_name)
+        if bindings is not None and "type" in node:
+            type_name = node["type"]
+            if pattern_text(type_name) is not None:
+                bindings = bindings if quote(type_name) == index.types[node_name] else None
+            else:
+                bindings = unify(bindings, type_name, index.types[node_name])
+        bindings = unify_props(bindings, node.get("properties") or {}, index.properties.get(node_name, {}))
+        if bindings is not None:
+            yield from match_caps(bindings, caps, index.capabilities.get(node_name, {}))
+
+
+def run_native_check(index: NodeIndex, check: CompiledCheck, stats: Optional[dict] = None) -> list[dict[str, str]]:
+    """Returns the results of the pattern check `check` against the nodes of
+    `index`, filling `stats` as `poc.run_check` does."""
+    start = time.perf_counter()
+    results = [{ext_var: format_value(bindings[ext_var]) for ext_var in check.ext_vars}
+        for bindings in match_pattern(index, check.pattern)] # type: ignore
+    if check.distinct:
+        results = list({tuple(res.values()): res for res in results}.values())
+    if stats is not None:
+        stats.update({
+            "status": "complete",
+            "reason": None,
+            "time": time.perf_counter() - start,
+            "inferences": 0,
+            "results": len(results),
+            "stack": 0
+        })
+    return results
+
+
+def diff_results(native: Iterable[dict[str, str]], prolog: Iterable[dict[str, str]]) -> tuple[Counter, Counter]:
+    """Returns the results found by the native engine only, and those found
+    by Prolog only, counting repeated results. Both engines may find them
+    in a different order."""
+    native_rows = Counter(tuple(res.values()) for res in native)
+    prolog_rows = Counter(tuple(res.values()) for res in prolog)
+    return native_rows - prolog_rows, prolog_rows - native_rows
+
+
+def print_differences(check: CompiledCheck, native: Iterable[dict[str, str]],
+        prolog: Iterable[dict[str, str]]) -> bool:
+    """Prints to stderr the results of `check` found by only one of the
+    engines, returning whether there are any."""
+    native_only, prolog_only = diff_results(native, prolog)
+    if not native_only and not prolog_only:
+        return False
+    print(f"{check.name}: native and Prolog results differ", file=sys.stderr)
+    for row in native_only.elements():
+        print(f"  native only: {row}", file=sys.stderr)
+    for row in prolog_only.elements():
+        print(f"  Prolog only: {row}", file=sys.stderr)
+    return True
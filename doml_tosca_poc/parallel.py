@@ -0,0 +1,50 @@
+"""Parallel execution of checks.
+
+Checks are distributed across a pool of worker processes, each running its
+own SWI-Prolog engine loaded with the same fact base and checks. Results
+are merged back in the order of the checks.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+from pyswip import Prolog
+
+from check2swipl import CompiledCheck
+from poc import assert_facts, get_fact_counts, init_prolog, load_checks, run_check
+
+# State of each worker process
+worker_prolog: Prolog
+worker_checks: dict[str, CompiledCheck]
+worker_profile: bool
+
+
+def init_worker(facts: list[str], checks_path: str, profile: bool):
+    global worker_prolog, worker_checks, worker_profile
+    worker_prolog = init_prolog()
+    assert_facts(worker_prolog, facts)
+    worker_checks = {check.name: check
+        for check in load_checks(worker_prolog, checks_path, get_fact_counts(worker_prolog))}
+    worker_profile = profile
+
+
+def run_worker_check(check_name: str) -> tuple[list[dict[str, str]], dict]:
+    stats: dict = {}
+    results = list(run_check(worker_prolog, worker_checks[check_name], stats=stats, profile=worker_profile))
+    return results, stats
+
+
+def run_checks_parallel(facts: list[str], checks_path: str, checks: list[CompiledCheck], workers: int,
+        profile: bool = False) -> Iterator[tuple[CompiledCheck, list[dict[str, str]], dict]]:
+    # Workers are spawned rather than forked, as an SWI-Prolog engine
+    # does not survive a fork
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(facts, checks_path, profile)
+    ) as executor:
+        # map yields results in the order of the checks, whatever the
+        # order in which they complete
+        for check, (results, stats) in zip(checks, executor.map(run_worker_check, [check.name for check in checks])):
+            yield check, results, stats
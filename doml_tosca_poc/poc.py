@@ -1,113 +1,488 @@
+from __future__ import annotations
+import argparse
+import gc
+import itertools
+import json
 import os
 import sys
-import re
+from collections import Counter
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 
-from pyswip import Prolog
+from pyswip import Atom, Prolog
 
-import yaml
-from yaml.loader import Loader, SafeLoader
+from yaml.nodes import MappingNode, Node
 
-class SafeLineLoader(SafeLoader):
-    def construct_mapping(self, node, deep=False):
-        mapping = super(SafeLineLoader, self).construct_mapping(node, deep=deep)
-        # Add 1 so line numbering starts at 1
-        mapping['__line__'] = node.start_mark.line + 1
-        return mapping
-
-from toscaparser.elements.capabilitytype import CapabilityTypeDef
-from toscaparser.tosca_template import ToscaTemplate
-from toscaparser.elements.nodetype import NodeType
-from toscaparser.nodetemplate import NodeTemplate
+# tosca-parser takes long to import, and is only needed on a cache miss
+if TYPE_CHECKING:
+    from native import NodeIndex
+    from toscaparser.elements.capabilitytype import CapabilityTypeDef
+    from toscaparser.tosca_template import ToscaTemplate
+    from toscaparser.elements.nodetype import NodeType
+    from toscaparser.nodetemplate import NodeTemplate
 
 from tosca2swipl import (
-    build_node_type_fact,
-    build_node_fact,
-    build_policy_fact,
-    build_cap_type_fact
+    build_ancestor_facts,
+    build_node_type_facts,
+    build_node_facts,
+    build_normative_facts,
+    build_policy_facts,
+    build_cap_type_facts,
+    get_functor,
+    get_normative_type_names,
+    get_parent_type_name
+)
+
+from check2swipl import CompiledCheck, build_check_goal, quote
+from report import REPORTERS
+from cache import (
+    FastSafeLoader,
+    build_startup_source,
+    cached_checks,
+    lookup_facts,
+    read_facts,
+    resolve_import,
+    startup_entry_path,
+    store_facts
 )
 
-from check2swipl import build_check_pred, fmt_result
+PREDICATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "predicates.pl")
+LOADER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loader.pl")
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile.pl")
+# Module holding the facts of the normative types, shared by every model
+NORMATIVE_MODULE = "normative_types"
+# Number of facts asserted by each query
+ASSERT_CHUNK_SIZE = 10000
+# Number of results of a check transferred from Prolog at a time
+RESULT_CHUNK_SIZE = 1000
+
+# Predicates holding the facts generated from a TOSCA model
+MODEL_PREDICATES = {
+    "node": 5,
+    "node_type": 5,
+    "cap_type": 3,
+    "policy": 3,
+    "node_type_ancestor": 2,
+    "cap_type_ancestor": 2,
+    "node_type_property": 4,
+    "node_type_capability": 3,
+    "node_type_requirement": 6,
+    "cap_type_property": 4,
+    "node_property": 3,
+    "node_capability": 2,
+    "node_capability_property": 4,
+    "node_requirement": 3,
+    "policy_target": 2,
+}
+# Model predicates describing types rather than nodes and policies
+TYPE_PREDICATES = [
+    "node_type",
+    "cap_type",
+    "node_type_ancestor",
+    "cap_type_ancestor",
+    "node_type_property",
+    "node_type_capability",
+    "node_type_requirement",
+    "cap_type_property",
+]
 
-def get_types_and_supertypes_for_nodes(node_tpls: list[NodeTemplate]):
-    def get_type_and_supertypes(ntype: NodeType) -> list[NodeType]:
-        if ntype.parent_type is None:
-            return [ntype]
-        else:
-            return [ntype] + get_type_and_supertypes(ntype.parent_type)
-    types: list[NodeType] = []
+def get_types_and_supertypes_for_nodes(node_tpls: list[NodeTemplate]) -> list[NodeType]:
+    types: dict[str, NodeType] = {}
     for node_tpl in node_tpls:
-        # Extend with new types that are not already in `types`
-        # checking by type name
-        type_names = [ntype.type for ntype in types]
-        types.extend(ntype
-            for ntype in get_type_and_supertypes(node_tpl.type_definition) # type: ignore
-            if ntype.type not in type_names)
-    return types
+        ntype = node_tpl.type_definition
+        # Once a type is known, so are all of its supertypes
+        while ntype is not None and ntype.type not in types:
+            types[ntype.type] = ntype
+            ntype = ntype.parent_type
+    return list(types.values())
 
 def get_captypes_and_parent_types_for_types(node_types: list[NodeType]) -> list[CapabilityTypeDef]:
-    def get_captype_and_parent_types(captype: CapabilityTypeDef) -> list[CapabilityTypeDef]:
-        if captype.parent_type is None:
-            return [captype]
-        else:
-            return [captype] + get_captype_and_parent_types(captype.parent_type)
-    captypes: list[CapabilityTypeDef] = []
+    captypes: dict[str, CapabilityTypeDef] = {}
     for ntype in node_types:
         for captype in ntype.get_capabilities_objects():
-            cap_names = [captype.type for captype in captypes]
-            captypes.extend(captype_
-                for captype_ in get_captype_and_parent_types(captype)
-                if captype_.type not in cap_names)
-    return captypes
-        
-
-tosca = ToscaTemplate(sys.argv[1])
-prolog = Prolog()
-with open(sys.argv[1]) as toscaf:
-    tosca_yaml = yaml.load(toscaf, Loader=SafeLineLoader)
-
-node_types = get_types_and_supertypes_for_nodes(tosca.nodetemplates)
-for node_type in node_types:
-    prolog.assertz(build_node_type_fact(node_type))
-    # print(build_node_type_fact(node_type))
-
-for cap_type in get_captypes_and_parent_types_for_types(node_types):
-    prolog.assertz(build_cap_type_fact(cap_type))
-
-for node_tpl in tosca.nodetemplates:
-    prolog.assertz(build_node_fact(node_tpl))
-
-for pol in tosca.topology_template.policies:
-    prolog.assertz(build_policy_fact(pol))
-
-prolog.consult(os.path.join(sys.path[0], "predicates.pl"))
-
-with open("checks.yaml") as checks_yaml_f:
-    check_yamls = yaml.load(checks_yaml_f, Loader=Loader)
-for check_yaml in check_yamls:
-    header, description, ext_vars, pred = build_check_pred(check_yaml)
-    prolog.assertz(pred)
-    results = prolog.query(header)
-    for ext_var in ext_vars:
-        description = re.sub(
-            re.escape(ext_var) + r"(?!\w)",
-            "{" + ext_var + "}",
-            description
-        )
-    for res in results:
-        fmt_dict = {ext_var: fmt_result(res[ext_vars[ext_var]]) for ext_var in ext_vars} # type: ignore
-        print(description.format(**fmt_dict))
-
-# hardcoded_db_passwords = prolog.query("has_hardcoded_db_password(X)")
-# for res in hardcoded_db_passwords:
-#     nodename = res['X'] # type: ignore
-#     line = tosca_yaml['topology_template']['node_templates'][nodename]['properties']['__line__']
-#     print(f"At line {line}: node {nodename} has a hardcoded password") # type: ignore
-
-# unsatisfied_requirements = prolog.query("has_unsatisfied_requirements(NodeName, TypeReq)")
-# if unsatisfied_requirements:
-#     print("\nUnsatisfied requirements:")
-#     for res in unsatisfied_requirements:
-#         nodename = res['NodeName'] # type: ignore
-#         line = tosca_yaml['topology_template']['node_templates'][nodename]['__line__']
-#         req = res['TypeReq'] # type: ignore
-#         print(f"At line {line}: node {nodename} has unsatisfied {req}")
\ No newline at end of file
+            # Once a type is known, so are all of its supertypes
+            while captype is not None and captype.type not in captypes:
+                captypes[captype.type] = captype
+                captype = captype.parent_type
+    return list(captypes.values())
+
+
+def collect_types(tosca: ToscaTemplate) -> tuple[list[NodeType], list[CapabilityTypeDef]]:
+    node_types = get_types_and_supertypes_for_nodes(tosca.nodetemplates)
+    return node_types, get_captypes_and_parent_types_for_types(node_types)
+
+
+def build_facts(tosca: ToscaTemplate,
+        types: Optional[tuple[list[NodeType], list[CapabilityTypeDef]]] = None) -> list[str]:
+    return list(iter_facts(tosca, types))
+
+
+def iter_facts(tosca: ToscaTemplate,
+        types: Optional[tuple[list[NodeType], list[CapabilityTypeDef]]] = None) -> Iterator[str]:
+    """Yields the facts of `tosca`, those of its types first and then those
+    of each node template and policy in turn, so that they can be written
+    out without ever being held all at once."""
+    # The types used by the model can be collected beforehand
+    node_types, cap_types = types or collect_types(tosca)
+    # The facts of the normative types are loaded once, at startup
+    normative = get_normative_type_names()
+    model_node_types = [node_type for node_type in node_types if node_type.type not in normative]
+    model_cap_types = [cap_type for cap_type in cap_types if cap_type.type not in normative]
+    for node_type in model_node_types:
+        yield from build_node_type_facts(node_type)
+    for cap_type in model_cap_types:
+        yield from build_cap_type_facts(cap_type)
+    yield from build_ancestor_facts("node_type_ancestor",
+        {node_type.type: get_parent_type_name(node_type) for node_type in node_types},
+        [node_type.type for node_type in model_node_types])
+    yield from build_ancestor_facts("cap_type_ancestor",
+        {cap_type.type: get_parent_type_name(cap_type) for cap_type in cap_types},
+        [cap_type.type for cap_type in model_cap_types])
+    for node_tpl in tosca.nodetemplates:
+        yield from build_node_facts(node_tpl)
+    for pol in tosca.topology_template.policies:
+        yield from build_policy_facts(pol)
+
+
+def init_prolog() -> Prolog:
+    """Starts Prolog with `predicates.pl`, `loader.pl`, `profile.pl` and the
+    facts of the normative types loaded from a precompiled startup file,
+    which is built on the first run."""
+    prolog = Prolog()
+    version = next(prolog.query("current_prolog_flag(version, V)"))["V"]
+    entry_path = startup_entry_path([PREDICATES_PATH, LOADER_PATH, PROFILE_PATH], version)
+    if os.path.exists(entry_path + ".qlf"):
+        list(prolog.query(f"load_files({quote(entry_path + '.qlf')}, [])"))
+    else:
+        build_startup(prolog, entry_path)
+    return prolog
+
+
+def build_startup(prolog: Prolog, entry_path: str):
+    tmp_path = f"{entry_path}.{os.getpid()}"
+    os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+    with open(tmp_path + ".pl", "w") as startup_f:
+        startup_f.write(build_startup_source([PREDICATES_PATH, LOADER_PATH, PROFILE_PATH], NORMATIVE_MODULE,
+            {pred: MODEL_PREDICATES[pred] for pred in TYPE_PREDICATES}, build_normative_facts()))
+    # qcompile also loads the file, and the .qlf is moved in place once
+    # complete, as concurrent runs may build it too
+    list(prolog.query(f"qcompile({quote(tmp_path + '.pl')})"))
+    os.replace(tmp_path + ".qlf", entry_path + ".qlf")
+    os.remove(tmp_path + ".pl")
+
+
+def declare_model_predicates(prolog: Prolog, module: str, predicates: Iterable[str] = MODEL_PREDICATES):
+    # Declaring the model predicates makes checks fail instead of raising
+    # an existence error when a model has e.g. no policies
+    for pred in predicates:
+        prolog.dynamic(f"{module}:{pred}/{MODEL_PREDICATES[pred]}")
+    type_preds = [f"{pred}/{MODEL_PREDICATES[pred]}" for pred in predicates if pred in TYPE_PREDICATES]
+    if type_preds:
+        list(prolog.query(f"link_normative_types({module}, [{', '.join(type_preds)}])"))
+
+
+def assert_facts(prolog: Prolog, facts: Iterable[str], module: str = "user",
+        predicates: Iterable[str] = MODEL_PREDICATES):
+    """Asserts `facts` into `module`, where `predicates`, the model
+    predicates the facts may belong to, are declared."""
+    declare_model_predicates(prolog, module, predicates)
+    # Each chunk of facts is parsed and asserted by a single query, and
+    # the text of the query for all of them is never built at once
+    facts = iter(facts)
+    while True:
+        chunk = list(itertools.islice(facts, ASSERT_CHUNK_SIZE))
+        if not chunk:
+            break
+        list(prolog.query(f"assert_facts({module}, [{', '.join(chunk)}])"))
+
+
+def get_mapping_value(node: Optional[Node], key: str) -> Optional[Node]:
+    if not isinstance(node, MappingNode):
+        return None
+    for key_node, value_node in node.value:
+        if key_node.value == key:
+            return value_node
+    return None
+
+
+def get_node_lines(root: Optional[Node]) -> dict[str, int]:
+    node_tpls = get_mapping_value(get_mapping_value(root, "topology_template"), "node_templates")
+    if not isinstance(node_tpls, MappingNode):
+        return {}
+    # Add 1 so line numbering starts at 1
+    return {key_node.value: key_node.start_mark.line + 1 for key_node, _ in node_tpls.value}
+
+
+def parse_model(model_path: str) -> tuple[dict, dict[str, int]]:
+    """Parses the TOSCA file at `model_path` once, returning both the
+    template and the line of each node template, taken from the YAML
+    nodes rather than added to the template."""
+    with open(model_path) as tosca_f:
+        loader = FastSafeLoader(tosca_f)
+        try:
+            root = loader.get_single_node()
+            tpl = loader.construct_document(root) if root is not None else {}
+        finally:
+            loader.dispose()
+    return tpl, get_node_lines(root)
+
+
+def load_tosca(model_path: str, tpl: Optional[dict] = None) -> ToscaTemplate:
+    """Builds the ToscaTemplate of the model at `model_path`, from its
+    already parsed template `tpl` if given."""
+    if tpl is None:
+        tpl, _ = parse_model(model_path)
+    # tosca-parser only accepts absolute file names in the imports of a
+    # pre-parsed template
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    if tpl.get("imports"):
+        tpl = {**tpl, "imports": [resolve_import(imp, model_dir)[0] for imp in tpl["imports"]]}
+    from toscaparser.tosca_template import ToscaTemplate
+    return ToscaTemplate(yaml_dict_tpl=tpl, a_file=False)
+
+
+def stream_model_facts(model_path: str) -> tuple[Iterator[str], Optional[str], dict[str, int]]:
+    """Returns the facts of the model at `model_path`, the cache file they
+    are read from, or None if the model can't be cached, and the line of
+    each of its node templates. The model is only parsed on a cache miss,
+    when its facts are streamed into the cache; those of a model that
+    can't be cached are generated as they are iterated instead."""
+    entry = lookup_facts(model_path)
+    if entry is not None:
+        facts_pl, node_lines = entry
+        return read_facts(facts_pl), facts_pl, node_lines
+    tpl, node_lines = parse_model(model_path)
+    imports = tpl.get("imports") or []
+    facts = iter_facts(load_tosca(model_path, tpl))
+    # tosca-parser keeps the template, which is thus released along with
+    # the ToscaTemplate once the facts are generated
+    del tpl
+    facts_pl = store_facts(model_path, facts, imports, node_lines)
+    if facts_pl is not None:
+        # The objects of tosca-parser refer to one another, so they are
+        # only freed by the cycle collector
+        gc.collect()
+    return (facts if facts_pl is None else read_facts(facts_pl)), facts_pl, node_lines
+
+
+def get_model_facts(model_path: str) -> list[str]:
+    facts, _, _ = stream_model_facts(model_path)
+    return list(facts)
+
+
+def load_facts_file(prolog: Prolog, facts_pl: str, module: str = "user"):
+    declare_model_predicates(prolog, module)
+    list(prolog.query(f"load_facts({quote(facts_pl)}, {module})"))
+
+
+def load_model_facts(prolog: Prolog, model_path: str, module: str = "user",
+        index: Optional[NodeIndex] = None) -> dict[str, int]:
+    """Loads the facts of the model at `model_path` into `module`, from the
+    cache if possible, so that the model is processed only on a cache miss,
+    and returns the line of each of its node templates. The facts are added
+    to `index` as well, if given, in the same pass."""
+    facts, facts_pl, node_lines = stream_model_facts(model_path)
+    if facts_pl is None:
+        assert_facts(prolog, facts if index is None else index.indexed(facts), module)
+    else:
+        load_facts_file(prolog, facts_pl, module)
+        if index is not None:
+            index.extend(facts)
+    return node_lines
+
+
+def retract_facts(prolog: Prolog, module: str = "user", facts: Optional[list[str]] = None):
+    """Retracts `facts` from `module`, or all of the model facts if `facts`
+    is None."""
+    if facts is not None:
+        list(prolog.query(f"retract_facts({module}, [{', '.join(facts)}])"))
+        return
+    for pred, arity in MODEL_PREDICATES.items():
+        args = ", ".join(["_"] * arity)
+        prolog.retractall(f"{module}:{pred}({args})")
+
+
+def get_fact_counts(prolog: Prolog, module: str = "user") -> dict[str, int]:
+    """Counts the facts of each model predicate in `module`, leaving out
+    the clause linking the type predicates to the normative types."""
+    counts = {}
+    for pred, arity in MODEL_PREDICATES.items():
+        head = f"{module}:{pred}({', '.join(['_'] * arity)})"
+        res = list(prolog.query(f"predicate_property({head}, number_of_clauses(C)), "
+            f"( predicate_property({head}, number_of_rules(R)) -> true ; R = 0 ), N is C - R"))
+        counts[pred] = res[0]["N"] if res else 0
+    return counts
+
+
+def load_checks(prolog: Prolog, checks_path: str, fact_counts: Optional[dict[str, int]] = None) -> list[CompiledCheck]:
+    """Loads the checks of `checks_path`, with their conjuncts ordered for
+    the number of facts in `fact_counts`, e.g. those of the model already
+    loaded, or for a typical model if not given."""
+    checks, checks_pl = cached_checks(checks_path, fact_counts)
+    # The checks are loaded as a file in one step rather than asserted one
+    # by one: reloading it replaces, instead of duplicating, their clauses,
+    # and `qcompile(auto)` keeps a .qlf beside it for later runs
+    list(prolog.query(f"load_files({quote(checks_pl)}, [qcompile(auto)])"))
+    return checks
+
+
+def fmt_result(res) -> str:
+    if type(res) is Atom:
+        return res.value
+    elif type(res) is list:
+        return "[" + ", ".join([fmt_result(r) for r in res]) + "]"
+    elif type(res) is bytes:
+        return res.decode('UTF-8')
+    else:
+        return str(res)
+
+
+def run_check(prolog: Prolog, check: CompiledCheck, module: str = "user",
+        stats: Optional[dict] = None, profile: bool = False) -> Iterator[dict[str, str]]:
+    """Yields the results of `check` against the facts of `module`, which
+    are transferred from Prolog in chunks of RESULT_CHUNK_SIZE. Once the
+    check is over, `stats` is filled with its status, which is
+    "inconclusive" if it was aborted for exceeding its limits, and with the
+    time, inferences, results and stack it took. If `profile` is set, the
+    inferences and time spent in each of its conjuncts are added as well."""
+    time_limit = "none" if check.time_limit is None else check.time_limit
+    inference_limit = "none" if check.inference_limit is None else check.inference_limit
+    check_vars = f"[{', '.join(check.ext_vars.values())}]"
+    if profile:
+        goal = f"profiled_body({module}, {check.header}, {check.name}, Body, Conjuncts), " \
+            f"collect_results({build_check_goal(check, f'{module}:Body')}, {check_vars}, " \
+            f"{time_limit}, {inference_limit}, {RESULT_CHUNK_SIZE}, Json, Done)"
+    else:
+        goal = f"collect_results({build_check_goal(check, f'{module}:{check.header}')}, {check_vars}, " \
+            f"{time_limit}, {inference_limit}, {RESULT_CHUNK_SIZE}, Json, Done)"
+    for res in prolog.query(goal):
+        for row in json.loads(fmt_result(res["Json"])):
+            yield dict(zip(check.ext_vars, row))
+        if type(res["Done"]) is not Atom:
+            done = res
+    status, reason, time, inferences, solutions, stack = done["Done"].args # type: ignore
+    if stats is not None:
+        stats.update({
+            "status": fmt_result(status),
+            "reason": None if fmt_result(reason) == "none" else fmt_result(reason),
+            "time": time,
+            "inferences": inferences,
+            "results": solutions,
+            "stack": stack
+        })
+    if profile and stats is not None:
+        conjuncts = [fmt_result(conjunct) for conjunct in done["Conjuncts"]] # type: ignore
+        costs = next(prolog.query(f"conjunct_costs({check.name}, {len(conjuncts)}, Costs)"))["Costs"]
+        stats["conjuncts"] = [{"goal": conjunct, "inferences": cost.args[0], "time": cost.args[1]}
+            for conjunct, cost in zip(conjuncts, costs)] # type: ignore
+
+
+def format_result(check: CompiledCheck, fmt_dict: dict[str, str]) -> str:
+    return check.template.format(**fmt_dict)
+
+
+def print_plans(checks: list[CompiledCheck]):
+    for check in checks:
+        print(f"{check.name}:", file=sys.stderr)
+        for step in check.plan:
+            print(f"  {step}", file=sys.stderr)
+
+
+def print_stats(check: CompiledCheck, stats: dict):
+    status = stats["status"] if stats["reason"] is None else f"{stats['status']} ({stats['reason']})"
+    print(f"{check.name}: {status}, {stats['results']} results, {stats['time']:.3f}s, "
+        f"{stats['inferences']} inferences, {stats['stack'] / 1024:.0f} KiB stack", file=sys.stderr)
+    for conjunct in stats.get("conjuncts", []):
+        print(f"  {conjunct['time']:8.3f}s {conjunct['inferences']:12} inferences  {conjunct['goal']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify a TOSCA model against the checks.")
+    parser.add_argument("model", help="TOSCA model to verify")
+    parser.add_argument("--checks", default="checks.yaml", help="checks file (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+        help="number of processes the checks are distributed across (default: %(default)s)")
+    parser.add_argument("--format", choices=list(REPORTERS), default="text",
+        help="output format (default: %(default)s)")
+    parser.add_argument("--plan", action="store_true",
+        help="print the order chosen for the conjuncts of each check, with their estimated solutions, to stderr")
+    parser.add_argument("--profile", action="store_true",
+        help="print the time, inferences and stack taken by each check and by its conjuncts to stderr")
+    parser.add_argument("--sharded", action="store_true",
+        help="verify the connected components of the model in separate worker processes")
+    parser.add_argument("--differential", action="store_true",
+        help="run the pattern checks with Prolog as well, and print where the results differ to stderr")
+    args = parser.parse_args()
+
+    # The model is only parsed if its facts are not cached, the lines of
+    # its node templates being cached along with them
+    if args.sharded or args.workers > 1:
+        fact_stream, _, node_lines = stream_model_facts(args.model)
+        facts = list(fact_stream)
+    else:
+        prolog = init_prolog()
+        # Pattern checks are evaluated on an index of the nodes instead of
+        # being queried from Prolog, which is filled as the facts are
+        # loaded. Whether a check is a pattern does not depend on its plan
+        index = None
+        if any(check.pattern is not None for check in cached_checks(args.checks)[0]):
+            from native import NodeIndex, print_differences, run_native_check
+            index = NodeIndex()
+        node_lines = load_model_facts(prolog, args.model, index=index)
+    reporter = REPORTERS[args.format](sys.stdout, args.model, node_lines)
+    # Whether the pattern checks got different results from Prolog
+    differences = False
+
+    def report_stats(check: CompiledCheck, stats: dict):
+        if stats["status"] == "inconclusive":
+            reporter.inconclusive(check, stats["reason"])
+        if args.profile:
+            print_stats(check, stats)
+
+    if args.sharded:
+        from shard import run_checks_sharded
+        # The same plans as those of the workers, which plan them for a
+        # typical model
+        checks, _ = cached_checks(args.checks)
+        if args.plan:
+            print_plans(checks)
+        reporter.start(checks)
+        for check, results, stats in run_checks_sharded(facts, args.checks, checks, args.workers, args.profile):
+            for res in results:
+                reporter.report(check, res, format_result(check, res))
+            report_stats(check, stats)
+    elif args.workers > 1:
+        from parallel import run_checks_parallel
+        # The same plans as those of the workers, which count the facts
+        # once loaded
+        fact_counts = {pred: 0 for pred in MODEL_PREDICATES}
+        fact_counts.update(Counter(get_functor(fact) for fact in facts))
+        checks, _ = cached_checks(args.checks, fact_counts)
+        if args.plan:
+            print_plans(checks)
+        reporter.start(checks)
+        for check, results, stats in run_checks_parallel(facts, args.checks, checks, args.workers, args.profile):
+            for res in results:
+                reporter.report(check, res, format_result(check, res))
+            report_stats(check, stats)
+    else:
+        checks = load_checks(prolog, args.checks, get_fact_counts(prolog))
+        if args.plan:
+            print_plans(checks)
+        reporter.start(checks)
+        for check in checks:
+            stats: dict = {}
+            if index is not None and check.pattern is not None:
+                results = run_native_check(index, check, stats)
+                if args.differential:
+                    prolog_stats: dict = {}
+                    prolog_results = list(run_check(prolog, check, stats=prolog_stats))
+                    if prolog_stats["status"] == "complete" and print_differences(check, results, prolog_results):
+                        differences = True
+            else:
+                results = run_check(prolog, check, stats=stats, profile=args.profile)
+            for res in results:
+                reporter.report(check, res, format_result(check, res))
+            report_stats(check, stats)
+    reporter.end()
+    if differences:
+        sys.exit(1)
@@ -1,38 +1,67 @@
+% Predicates reading the model facts are module-transparent, and look up
+% those facts in the module they are called in, i.e. that of the calling
+% check, so that the facts of each model can live in a module of their
+% own. A plain goal would instead be resolved in `user`, where these
+% predicates are defined.
+:- module_transparent
+    extends_node_type/2,
+    extends_cap_type/2,
+    type_offers_capability/2,
+    type_has_requirement/2,
+    requirement_satisfied/2,
+    valid_requirement_target/3.
+
+% The transitive closure of the type hierarchies is generated along with
+% the model facts, so a subtype test is a single indexed lookup
 extends_node_type(TypeA, TypeA).
 extends_node_type(TypeA, TypeB) :-
-    node_type(TypeA, ExtTypeA, _, _, _),
-    ExtTypeA \= none,
-    extends_node_type(ExtTypeA, TypeB).
+    context_module(M),
+    M:node_type_ancestor(TypeA, TypeB).
 
 extends_cap_type(TypeA, TypeA).
 extends_cap_type(TypeA, TypeB) :-
-    cap_type(TypeA, ExtTypeA, _),
-    ExtTypeA \= none,
-    extends_cap_type(ExtTypeA, TypeB).
+    context_module(M),
+    M:cap_type_ancestor(TypeA, TypeB).
 
 % capabilities of ancestor types are automatically filled in by tosca-parser,
 % so there is no need to use extends_node_type
 type_offers_capability(Type, CapType) :-
-    node_type(Type, _, _, Caps, _),
-    member(capability(_, NCapType), Caps),
-    extends_cap_type(NCapType, CapType).
+    context_module(M),
+    M:node_type_capability(Type, _, NCapType),
+    M:extends_cap_type(NCapType, CapType).
 
 % requirements of ancestor types are automatically filled in by tosca-parser,
 % so there is no need to use extends_node_type
-type_has_requirement(Type, Req) :-
-    node_type(Type, _, _, _, Reqs),
-    member(Req, Reqs).
+type_has_requirement(Type, requirement(ReqName, CapType, NodeType, Rel, Occ)) :-
+    context_module(M),
+    M:node_type_requirement(Type, ReqName, CapType, NodeType, Rel, Occ).
+
+% A requirement is satisfied when the number of entries of the node for
+% it whose target is valid is within its occurrences. Each entry is
+% resolved to its target once, instead of trying every combination of
+% entries as selecting them one occurrence at a time would
+requirement_satisfied(NodeReqs, requirement(ReqName, CapType, ReqNodeType, _, occurrences(OccBot, OccTop))) :-
+    context_module(M),
+    aggregate_all(count,
+        (   member(requirement(ReqName, NodeName), NodeReqs),
+            M:valid_requirement_target(NodeName, CapType, ReqNodeType)
+        ),
+        Count),
+    Count >= OccBot,
+    (   OccTop == unbounded
+    ->  true
+    ;   Count =< OccTop
+    ).
 
-requirement_satisfied(_, requirement(_, _, _, _, occurrences(0, _))) :- !.
-requirement_satisfied(NodeReqs, requirement(ReqName, CapType, ReqNodeType, ReqRel, occurrences(OccBot, OccTop))) :-
-    select(requirement(ReqName, NodeName), NodeReqs, LeftNodeReqs),
-    node(NodeName, NodeType, _, _, _),
-    type_offers_capability(NodeType, CapType),
-    extends_node_type(NodeType, ReqNodeType),
-    NewOccBot is OccBot-1,
-    requirement_satisfied(LeftNodeReqs, requirement(ReqName, CapType, ReqNodeType, ReqRel, occurrences(NewOccBot, OccTop))).
+valid_requirement_target(NodeName, CapType, ReqNodeType) :-
+    context_module(M),
+    once((
+        M:node(NodeName, NodeType, _, _, _),
+        M:extends_node_type(NodeType, ReqNodeType),
+        M:type_offers_capability(NodeType, CapType)
+    )).
 
 subset([ ],_).
 subset([H|T],List) :-
     member(H,List),
-    subset(T,List).
\ No newline at end of file
+    subset(T,List).
@@ -0,0 +1,217 @@
+:- use_module(library(time)).
+:- use_module(library(http/json)).
+
+% instrumented_call(:Goal, +TimeLimit, +InferenceLimit, -Result)
+%
+% Calls Goal, with Result = solution for each of its solutions, and a last
+% time, once Goal is exhausted or aborted, with
+% Result = done(Status, Reason, Time, Inferences, Solutions, Stack).
+% Goal is aborted, with Status = inconclusive, when it runs for longer
+% than TimeLimit seconds, when it takes more than InferenceLimit
+% inferences to find any one solution, or when it runs out of stack;
+% otherwise Status = complete. Either limit may be `none`. Time and
+% Inferences are those spent in Goal, leaving out those spent on its
+% solutions by the caller. Stack is the size the stacks were grown to,
+% which approximates their peak usage.
+instrumented_call(Goal, TimeLimit, InferenceLimit, Result) :-
+    trim_stacks,
+    statistics(inferences, Inferences0),
+    get_time(Time0),
+    State = state(complete, none, 0),
+    Clock = clock(Time0, Inferences0, Time0, Inferences0),
+    (   setup_call_cleanup(
+            start_time_limit(TimeLimit, Alarm),
+            catch(
+                (   limited_call(Goal, InferenceLimit, State),
+                    suspend_clock(Clock, Alarm, TimeLimit)
+                ),
+                Error, abort_call(Error, State)),
+            stop_time_limit(Alarm)),
+        arg(3, State, Solutions0),
+        Solutions is Solutions0 + 1,
+        nb_setarg(3, State, Solutions),
+        Result = solution
+    ;   statistics(inferences, Inferences1),
+        get_time(Time1),
+        statistics(global, Global),
+        statistics(local, Local),
+        statistics(trail, Trail),
+        State = state(Status, Reason, Solutions),
+        Clock = clock(Start, StartInferences, _, _),
+        Time is Time1 - Start,
+        Inferences is Inferences1 - StartInferences,
+        Stack is Global + Local + Trail,
+        Result = done(Status, Reason, Time, Inferences, Solutions, Stack)
+    ).
+
+% suspend_clock(+Clock, +Alarm, +TimeLimit)
+%
+% Stops the alarm, and the time and inferences counted, while a solution
+% of Goal is handed over, e.g. while the chunk of results holding it is
+% written and transferred to Python, and starts them again once Goal is
+% backtracked into. Both happen within the catch/3 of instrumented_call/4,
+% so that an alarm going off meanwhile aborts Goal as well.
+suspend_clock(Clock, Alarm, _) :-
+    suspend_time_limit(Alarm),
+    get_time(Time),
+    statistics(inferences, Inferences),
+    nb_setarg(3, Clock, Time),
+    nb_setarg(4, Clock, Inferences).
+suspend_clock(Clock, Alarm, TimeLimit) :-
+    get_time(Time),
+    statistics(inferences, Inferences),
+    Clock = clock(Start0, StartInferences0, Suspended, SuspendedInferences),
+    Start is Start0 + Time - Suspended,
+    StartInferences is StartInferences0 + Inferences - SuspendedInferences,
+    nb_setarg(1, Clock, Start),
+    nb_setarg(2, Clock, StartInferences),
+    resume_time_limit(Alarm, TimeLimit, Time - Start),
+    fail.
+
+% collect_results(:Goal, +Vars, +TimeLimit, +InferenceLimit, +ChunkSize, -Json, -Done)
+%
+% Calls Goal as instrumented_call/4 does, collecting the bindings of Vars
+% in chunks of at most ChunkSize of its solutions, so that they are
+% transferred a chunk at a time rather than one solution at a time, and
+% only one chunk is held in memory. Each solution is a chunk, Json being
+% the text of a JSON array holding, for each solution of Goal in it, the
+% list of the bindings written as text. Done is the last result of
+% instrumented_call/4 in the last chunk, and none in the others.
+collect_results(Goal, Vars, TimeLimit, InferenceLimit, ChunkSize, Json, Done) :-
+    findnsols(ChunkSize, Vars-Result, instrumented_call(Goal, TimeLimit, InferenceLimit, Result), Solutions),
+    (   append(Found, [_-Last], Solutions),
+        Last = done(_, _, _, _, _, _)
+    ->  Done = Last
+    ;   Found = Solutions,
+        Done = none
+    ),
+    maplist(binding_texts, Found, Rows),
+    with_output_to(string(Json), json_write(current_output, Rows, [width(0)])).
+
+binding_texts(Bindings-solution, Texts) :-
+    maplist(binding_text, Bindings, Texts).
+
+% Bindings are written as pyswip converts them, with a space after the
+% commas of lists and compound terms
+binding_text(Binding, Text) :-
+    with_output_to(string(Text), write_term(Binding, [spacing(next_argument)])).
+
+start_time_limit(none, none) :- !.
+start_time_limit(TimeLimit, Alarm) :-
+    alarm(TimeLimit, throw(time_limit_exceeded), Alarm, [remove(false)]).
+
+stop_time_limit(none) :- !.
+stop_time_limit(Alarm) :-
+    remove_alarm(Alarm).
+
+suspend_time_limit(none) :- !.
+suspend_time_limit(Alarm) :-
+    uninstall_alarm(Alarm).
+
+% The alarm goes off once Goal has run for TimeLimit seconds in all
+resume_time_limit(none, _, _) :- !.
+resume_time_limit(Alarm, TimeLimit, Elapsed) :-
+    Remaining is max(TimeLimit - Elapsed, 0),
+    install_alarm(Alarm, Remaining).
+
+limited_call(Goal, none, _) :- !,
+    call(Goal).
+limited_call(Goal, InferenceLimit, State) :-
+    call_with_inference_limit(Goal, InferenceLimit, Result),
+    (   Result == inference_limit_exceeded
+    ->  set_inconclusive(State, inference_limit_exceeded)
+    ;   true
+    ).
+
+abort_call(time_limit_exceeded, State) :- !,
+    set_inconclusive(State, time_limit_exceeded).
+abort_call(error(resource_error(Resource), _), State) :- !,
+    set_inconclusive(State, Resource).
+abort_call(Error, _) :-
+    throw(Error).
+
+set_inconclusive(State, Reason) :-
+    nb_setarg(1, State, inconclusive),
+    nb_setarg(2, State, Reason),
+    fail.
+
+% profiled_body(+Module, +Head, +Name, -Body, -Conjuncts)
+%
+% Body is the body of the clause of the check Head, run against the facts
+% of Module, with each of its top-level conjuncts wrapped so that the
+% inferences and CPU time spent in it, including on backtracking, are
+% added to the counters of check Name. Conjuncts is the text of each
+% conjunct, with the counters reset.
+profiled_body(Module, Head, Name, Body, Conjuncts) :-
+    clause(Head, (context_module(Module), Body0)),
+    wrap_conjuncts(Body0, Name, 0, _, Body),
+    copy_term(Body0, Named),
+    numbervars(Named, 0, _),
+    conjunct_texts(Named, Conjuncts).
+
+wrap_conjuncts((A, B), Name, I0, I, (WrappedA, WrappedB)) :- !,
+    wrap_conjuncts(A, Name, I0, I1, WrappedA),
+    wrap_conjuncts(B, Name, I1, I, WrappedB).
+wrap_conjuncts(Goal, Name, I0, I, profile_conjunct(Name, I0, Goal)) :-
+    I is I0 + 1,
+    conjunct_flag(Name, I0, inferences, InferencesKey),
+    conjunct_flag(Name, I0, time, TimeKey),
+    flag(InferencesKey, _, 0),
+    flag(TimeKey, _, 0).
+
+% flag/3 keys a compound term by its name and arity only, so each counter
+% of each conjunct of each check is keyed by an atom of its own
+conjunct_flag(Name, I, Counter, Key) :-
+    format(atom(Key), '~w/~w/~w', [Name, I, Counter]).
+
+conjunct_texts((A, B), Texts) :- !,
+    conjunct_texts(A, TextsA),
+    conjunct_texts(B, TextsB),
+    append(TextsA, TextsB, Texts).
+conjunct_texts(_:Goal, Texts) :- !,
+    conjunct_texts(Goal, Texts).
+conjunct_texts(Goal, [Text]) :-
+    format(string(Text), "~W", [Goal, [quoted(true), numbervars(true)]]).
+
+% Conjuncts are called in the module of the model the check runs against
+:- module_transparent profile_conjunct/3.
+
+profile_conjunct(Name, I, Goal) :-
+    statistics(inferences, Inferences0),
+    statistics(cputime, Time0),
+    Start = start(Inferences0, Time0),
+    (   call(Goal),
+        (   charge_conjunct(Name, I, Start)
+        ;   % Backtracking into Goal
+            statistics(inferences, Inferences1),
+            statistics(cputime, Time1),
+            nb_setarg(1, Start, Inferences1),
+            nb_setarg(2, Start, Time1),
+            fail
+        )
+    ;   charge_conjunct(Name, I, Start),
+        fail
+    ).
+
+charge_conjunct(Name, I, start(Inferences0, Time0)) :-
+    statistics(inferences, Inferences1),
+    statistics(cputime, Time1),
+    conjunct_flag(Name, I, inferences, InferencesKey),
+    conjunct_flag(Name, I, time, TimeKey),
+    flag(InferencesKey, Inferences, Inferences + Inferences1 - Inferences0),
+    flag(TimeKey, Time, Time + Time1 - Time0).
+
+% conjunct_costs(+Name, +N, -Costs)
+%
+% Costs holds cost(Inferences, Time) for each of the N conjuncts of the
+% check Name.
+conjunct_costs(Name, N, Costs) :-
+    Last is N - 1,
+    findall(cost(Inferences, Time),
+        (   between(0, Last, I),
+            conjunct_flag(Name, I, inferences, InferencesKey),
+            conjunct_flag(Name, I, time, TimeKey),
+            flag(InferencesKey, Inferences, Inferences),
+            flag(TimeKey, Time, Time)
+        ),
+        Costs).
@@ -0,0 +1,135 @@
+"""Reporters writing the results of the checks as they are produced.
+
+Each result is written and flushed as soon as it is reported, so that
+downstream tools can consume it before the checks are over, and nothing is
+kept in memory meanwhile.
+"""
+import json
+from typing import Optional, TextIO
+
+from check2swipl import CompiledCheck
+
+
+class Reporter:
+    def __init__(self, out: TextIO, model_path: str, node_lines: dict[str, int]):
+        self.out = out
+        self.model_path = model_path
+        # Line of the definition of each node template
+        self.node_lines = node_lines
+
+    def start(self, checks: list[CompiledCheck]):
+        pass
+
+    def set_model(self, model_path: str, node_lines: dict[str, int]):
+        # The results that follow refer to another model, when reporting
+        # on a batch of models
+        self.model_path = model_path
+        self.node_lines = node_lines
+
+    def report(self, check: CompiledCheck, bindings: dict[str, str], message: str):
+        raise NotImplementedError
+
+    def inconclusive(self, check: CompiledCheck, reason: str):
+        # The check was aborted, so its results may be incomplete
+        raise NotImplementedError
+
+    def end(self):
+        pass
+
+    def get_line(self, bindings: dict[str, str]) -> Optional[int]:
+        # Results are located at the first node among the bindings
+        for val in bindings.values():
+            if val in self.node_lines:
+                return self.node_lines[val]
+        return None
+
+    def write(self, s: str):
+        self.out.write(s)
+        self.out.flush()
+
+
+class TextReporter(Reporter):
+    def set_model(self, model_path: str, node_lines: dict[str, int]):
+        super().set_model(model_path, node_lines)
+        self.write(f"{model_path}:\n")
+
+    def report(self, check: CompiledCheck, bindings: dict[str, str], message: str):
+        self.write(message + "\n")
+
+    def inconclusive(self, check: CompiledCheck, reason: str):
+        self.write(f"Check {check.name} is inconclusive: {reason}\n")
+
+
+class JsonLinesReporter(Reporter):
+    def report(self, check: CompiledCheck, bindings: dict[str, str], message: str):
+        self.write(json.dumps({
+            "check": check.name,
+            "bindings": {ext_var[1:]: val for ext_var, val in bindings.items()},
+            "message": message,
+            "file": self.model_path,
+            "line": self.get_line(bindings)
+        }) + "\n")
+
+    def inconclusive(self, check: CompiledCheck, reason: str):
+        self.write(json.dumps({
+            "check": check.name,
+            "status": "inconclusive",
+            "reason": reason,
+            "file": self.model_path
+        }) + "\n")
+
+
+class SarifReporter(Reporter):
+    # The SARIF log is a single JSON document: its results array is written
+    # one result at a time between the header, which holds the rules, and
+    # the footer
+    def start(self, checks: list[CompiledCheck]):
+        rules = [{"id": check.name, "fullDescription": {"text": check.description}} for check in checks]
+        header = json.dumps({
+            "version": "2.1.0",
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "runs": [{"tool": {"driver": {"name": "doml_tosca_poc", "rules": rules}}, "results": []}]
+        })
+        # Leave the results array open
+        self.write(header[:-len("]}]}")] + "\n")
+        self.first_result = True
+        # Inconclusive checks are reported in the footer, as notifications
+        # of the invocation
+        self.notifications: list[dict] = []
+
+    def report(self, check: CompiledCheck, bindings: dict[str, str], message: str):
+        location: dict = {"artifactLocation": {"uri": self.model_path}}
+        line = self.get_line(bindings)
+        if line is not None:
+            location["region"] = {"startLine": line}
+        result = json.dumps({
+            "ruleId": check.name,
+            "level": "warning",
+            "message": {"text": message},
+            "locations": [{"physicalLocation": location}],
+            "properties": {"bindings": {ext_var[1:]: val for ext_var, val in bindings.items()}}
+        })
+        self.write(("" if self.first_result else ",\n") + result)
+        self.first_result = False
+
+    def inconclusive(self, check: CompiledCheck, reason: str):
+        self.notifications.append({
+            "level": "warning",
+            "message": {"text": f"Check {check.name} is inconclusive: {reason}"},
+            "associatedRule": {"id": check.name},
+            "locations": [{"physicalLocation": {"artifactLocation": {"uri": self.model_path}}}]
+        })
+
+    def end(self):
+        invocation = json.dumps({
+            "executionSuccessful": True,
+            "toolExecutionNotifications": self.notifications
+        })
+        self.write(f"\n], \"invocations\": [{invocation}]}}]}}\n")
+
+
+REPORTERS = {
+    "text": TextReporter,
+    "jsonl": JsonLinesReporter,
+    "sarif": SarifReporter,
+}
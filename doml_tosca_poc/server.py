@@ -0,0 +1,186 @@
+"""Resident verification server.
+
+Keeps SWI-Prolog, `predicates.pl` and the compiled checks loaded between
+requests, so that only the models themselves are processed on each request.
+Models are POSTed as JSON, either as a single model or as a batch:
+
+    {"model": "doml_tosca.yaml"}
+    {"models": ["a.yaml", {"path": "b.yaml"}, {"template": {...}}]}
+
+where each model is a path to a TOSCA file or an already parsed template.
+The facts of each model are asserted in a Prolog module of their own and
+retracted once the checks have run.
+
+Models sent within a session are instead kept loaded, and each new version
+of the model is verified incrementally: the response only holds the
+violations that appeared or were resolved since the previous version.
+
+    {"session": "webapp", "model": "doml_tosca.yaml"}
+    {"session": "webapp", "close": true}
+"""
+import argparse
+import json
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from poc import (
+    assert_facts,
+    build_facts,
+    format_result,
+    get_model_facts,
+    init_prolog,
+    load_checks,
+    load_model_facts,
+    retract_facts,
+    run_check
+)
+from incremental import IncrementalVerifier
+
+
+def build_template_facts(tpl: dict) -> list[str]:
+    # tosca-parser takes long to import, and is only needed for the models
+    # sent as templates
+    from toscaparser.tosca_template import ToscaTemplate
+    return build_facts(ToscaTemplate(yaml_dict_tpl=tpl, a_file=False))
+
+
+def get_model_path(model) -> Optional[str]:
+    if type(model) is str:
+        return model
+    elif type(model) is dict and "path" in model:
+        return model["path"]
+    elif type(model) is dict and "template" in model:
+        return None
+    else:
+        raise ValueError("Model must be a path or have either a 'path' or a 'template' key")
+
+
+class Verifier:
+    def __init__(self, checks_path: str):
+        self.prolog = init_prolog()
+        self.checks = load_checks(self.prolog, checks_path)
+        self.sessions: dict[str, IncrementalVerifier] = {}
+        self.session_count = 0
+
+    def verify(self, models: list) -> list[dict]:
+        # Modules are emptied after each model, so their names can be
+        # reused across requests
+        return [self.verify_model(model, f"model_{i}") for i, model in enumerate(models)]
+
+    def verify_model(self, model, module: str) -> dict:
+        result: dict = {"model": module}
+        try:
+            model_path = get_model_path(model)
+            # Models given as paths go through the fact cache
+            if model_path is not None:
+                result["model"] = model_path
+                load_model_facts(self.prolog, model_path, module)
+            else:
+                assert_facts(self.prolog, build_template_facts(model["template"]), module)
+            violations = []
+            inconclusive = []
+            for check in self.checks:
+                stats: dict = {}
+                for res in run_check(self.prolog, check, module, stats):
+                    violations.append({
+                        "check": check.name,
+                        "bindings": {ext_var[1:]: val for ext_var, val in res.items()},
+                        "message": format_result(check, res)
+                    })
+                if stats["status"] == "inconclusive":
+                    inconclusive.append({"check": check.name, "reason": stats["reason"]})
+            result["violations"] = violations
+            result["inconclusive"] = inconclusive
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            retract_facts(self.prolog, module)
+        return result
+
+    def verify_incremental(self, session: str, model) -> dict:
+        if session not in self.sessions:
+            self.sessions[session] = IncrementalVerifier(
+                self.prolog, self.checks, f"session_{self.session_count}")
+            self.session_count += 1
+        model_path = get_model_path(model)
+        if model_path is not None:
+            facts = get_model_facts(model_path)
+        else:
+            facts = build_template_facts(model["template"])
+        checks = {check.name: check for check in self.checks}
+        delta = self.sessions[session].update(facts)
+        return {
+            check_name: {
+                change: [
+                    {
+                        "bindings": {ext_var[1:]: val for ext_var, val in res.items()},
+                        "message": format_result(checks[check_name], res)
+                    }
+                    for res in results
+                ] if change != "inconclusive" else results
+                for change, results in check_delta.items()
+            }
+            for check_name, check_delta in delta.items()
+        }
+
+    def close_session(self, session: str):
+        if session in self.sessions:
+            self.sessions.pop(session).close()
+
+
+class VerificationServer(HTTPServer):
+    # pyswip does not support concurrent queries, so requests are served
+    # one at a time by a plain (non-threading) HTTPServer
+    def __init__(self, address, verifier: Verifier):
+        super().__init__(address, VerificationHandler)
+        self.verifier = verifier
+
+
+class VerificationHandler(BaseHTTPRequestHandler):
+    server: VerificationServer
+
+    def do_POST(self):
+        verifier = self.server.verifier
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            if "session" in request:
+                session = str(request["session"])
+                if request.get("close"):
+                    verifier.close_session(session)
+                    self.send_json(200, {"session": session})
+                    return
+                model = request["model"]
+            else:
+                models = request["models"] if "models" in request else [request["model"]]
+                assert type(models) is list, "'models' must be a list"
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            self.send_json(400, {"error": f"Malformed request: {e}"})
+            return
+        if "session" in request:
+            try:
+                self.send_json(200, {"session": session, "delta": verifier.verify_incremental(session, model)})
+            except Exception as e:
+                self.send_json(200, {"session": session, "error": str(e)})
+        else:
+            self.send_json(200, {"results": verifier.verify(models)})
+
+    def send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve TOSCA model verification over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--checks", default="checks.yaml", help="checks file (default: %(default)s)")
+    args = parser.parse_args()
+
+    server = VerificationServer((args.host, args.port), Verifier(args.checks))
+    print(f"Serving on {args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,208 @@
+"""Sharded verification of models made of independent sub-deployments.
+
+The nodes of a model are partitioned into the connected components of the
+graph of their requirements and of the targets of its policies. The
+components are packed into one shard per worker process, and each shard is
+verified by a worker loaded with the facts of its nodes and policies and
+of the types they use only. Checks declared `global` in the checks file,
+which may relate nodes of different components, are run against the full
+model instead, as are the checks with a `limit`, `offset` or `exists`,
+whose results depend on the order they are found in. The results of the
+shards are merged in the order of the checks.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from pyswip import Prolog
+
+from check2swipl import CompiledCheck, quoted_re
+from poc import TYPE_PREDICATES, assert_facts, init_prolog, load_checks, retract_facts, run_check
+from tosca2swipl import get_functor
+
+# Model predicates whose first argument is a node, and the position of the
+# types referred to by the facts of each type predicate
+NODE_PREDICATES = ["node", "node_property", "node_capability", "node_capability_property", "node_requirement"]
+TYPE_REFERENCES = {
+    "node_type_ancestor": [1],
+    "cap_type_ancestor": [1],
+    "node_type_capability": [2],
+    "node_type_requirement": [2, 3],
+}
+
+# State of each worker process
+worker_prolog: Prolog
+worker_checks: dict[str, CompiledCheck]
+worker_profile: bool
+
+
+def get_atoms(fact: str) -> list[str]:
+    # The quoted arguments of a fact come first, and name the nodes,
+    # policies and types it refers to
+    return quoted_re.findall(fact)
+
+
+def find(parents: dict[str, str], node: str) -> str:
+    while parents[node] != node:
+        parents[node] = parents[parents[node]]
+        node = parents[node]
+    return node
+
+
+def union(parents: dict[str, str], node_a: str, node_b: str):
+    parents.setdefault(node_a, node_a)
+    parents.setdefault(node_b, node_b)
+    parents[find(parents, node_a)] = find(parents, node_b)
+
+
+def build_shards(facts: list[str], count: int) -> list[list[str]]:
+    """Partitions `facts` into at most `count` shards, each holding whole
+    connected components of nodes, with their policies and the type facts
+    they need, and as evenly sized as possible."""
+    type_facts: dict[str, list[str]] = {}
+    type_references: dict[str, set[str]] = {}
+    node_facts: dict[str, list[str]] = {}
+    node_types: dict[str, str] = {}
+    policy_facts: dict[str, list[str]] = {}
+    policy_targets: dict[str, list[str]] = {}
+    parents: dict[str, str] = {}
+    for fact in facts:
+        functor = get_functor(fact)
+        atoms = get_atoms(fact)
+        if functor in TYPE_PREDICATES:
+            type_facts.setdefault(atoms[0], []).append(fact)
+            type_references.setdefault(atoms[0], set()).update(atoms[i] for i in TYPE_REFERENCES.get(functor, []))
+        elif functor in NODE_PREDICATES:
+            node_facts.setdefault(atoms[0], []).append(fact)
+            parents.setdefault(atoms[0], atoms[0])
+            if functor == "node":
+                node_types[atoms[0]] = atoms[1]
+            elif functor == "node_requirement":
+                union(parents, atoms[0], atoms[2])
+        else:
+            policy_facts.setdefault(atoms[0], []).append(fact)
+            if functor == "policy_target":
+                policy_targets.setdefault(atoms[0], []).append(atoms[1])
+    for targets in policy_targets.values():
+        parents.setdefault(targets[0], targets[0])
+        for target in targets[1:]:
+            union(parents, targets[0], target)
+
+    components: dict[str, list[str]] = {}
+    for node in node_facts:
+        components.setdefault(find(parents, node), []).append(node)
+    component_policies: dict[Optional[str], list[str]] = {}
+    for policy in policy_facts:
+        targets = policy_targets.get(policy)
+        component_policies.setdefault(find(parents, targets[0]) if targets else None, []).append(policy)
+
+    # Largest components first, each into the smallest shard so far
+    shards: list[tuple[list[str], list[str]]] = [([], []) for _ in range(max(count, 1))]
+    sizes = [0] * len(shards)
+    for root, nodes in sorted(components.items(), key=lambda component: -len(component[1])):
+        i = sizes.index(min(sizes))
+        shards[i][0].extend(nodes)
+        shards[i][1].extend(component_policies.get(root, []))
+        sizes[i] += sum(len(node_facts[node]) for node in nodes)
+    # Policies without targets, or targeting groups only, go along with
+    # the first shard
+    for root, policies in component_policies.items():
+        if root not in components:
+            shards[0][1].extend(policies)
+
+    shard_facts = []
+    for nodes, policies in shards:
+        if not nodes and shard_facts:
+            continue
+        types = []
+        seen: set[str] = set()
+        pending = [node_types[node] for node in nodes if node in node_types]
+        while pending:
+            type_name = pending.pop()
+            if type_name not in seen:
+                seen.add(type_name)
+                types.append(type_name)
+                pending.extend(type_references.get(type_name, []))
+        shard_facts.append([fact for type_name in types for fact in type_facts.get(type_name, [])]
+            + [fact for node in nodes for fact in node_facts[node]]
+            + [fact for policy in policies for fact in policy_facts[policy]])
+    return shard_facts
+
+
+def init_worker(checks_path: str, profile: bool):
+    global worker_prolog, worker_checks, worker_profile
+    worker_prolog = init_prolog()
+    # The workers verify shards of varying sizes, so the checks are planned
+    # for a typical model
+    worker_checks = {check.name: check for check in load_checks(worker_prolog, checks_path)}
+    worker_profile = profile
+
+
+def verify_shard(facts: list[str], check_names: list[str]) -> dict[str, tuple[list[dict[str, str]], dict]]:
+    """Runs the checks named `check_names` against `facts`."""
+    outcomes = {}
+    assert_facts(worker_prolog, facts)
+    try:
+        for check_name in check_names:
+            check = worker_checks[check_name]
+            stats: dict = {}
+            results = list(run_check(worker_prolog, check, stats=stats, profile=worker_profile))
+            outcomes[check_name] = (results, stats)
+    finally:
+        retract_facts(worker_prolog)
+    return outcomes
+
+
+def merge_outcomes(check: CompiledCheck, outcomes: list[tuple[list[dict[str, str]], dict]]) \
+        -> tuple[list[dict[str, str]], dict]:
+    results = [res for shard_results, _ in outcomes for res in shard_results]
+    # Shards may find the same results, e.g. when they bind the external
+    # variables to types only
+    if check.distinct:
+        results = list({tuple(res.values()): res for res in results}.values())
+    shard_stats = [stats for _, stats in outcomes]
+    stats = {
+        "status": "inconclusive" if any(s["status"] == "inconclusive" for s in shard_stats) else "complete",
+        "reason": next((s["reason"] for s in shard_stats if s["reason"] is not None), None),
+        "time": sum(s["time"] for s in shard_stats),
+        "inferences": sum(s["inferences"] for s in shard_stats),
+        "results": len(results),
+        "stack": max(s["stack"] for s in shard_stats)
+    }
+    if "conjuncts" in shard_stats[0]:
+        stats["conjuncts"] = [
+            {
+                "goal": conjuncts[0]["goal"],
+                "inferences": sum(conjunct["inferences"] for conjunct in conjuncts),
+                "time": sum(conjunct["time"] for conjunct in conjuncts)
+            }
+            for conjuncts in zip(*(s["conjuncts"] for s in shard_stats))
+        ]
+    return results, stats
+
+
+def run_checks_sharded(facts: list[str], checks_path: str, checks: list[CompiledCheck], workers: int,
+        profile: bool = False) -> Iterator[tuple[CompiledCheck, list[dict[str, str]], dict]]:
+    # A shard applying a limit or an offset could not tell which of its
+    # results are left once those of the other shards are merged
+    full_checks = {check.name for check in checks
+        if check.is_global or check.limit is not None or check.offset or check.exists}
+    local_names = [check.name for check in checks if check.name not in full_checks]
+    global_names = [check.name for check in checks if check.name in full_checks]
+    # Workers are spawned rather than forked, as an SWI-Prolog engine
+    # does not survive a fork
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(checks_path, profile)
+    ) as executor:
+        shard_futures = [executor.submit(verify_shard, shard, local_names)
+            for shard in build_shards(facts, workers)] if local_names else []
+        global_future = executor.submit(verify_shard, facts, global_names) if global_names else None
+        for check in checks:
+            if check.name in full_checks:
+                results, stats = global_future.result()[check.name] # type: ignore
+            else:
+                results, stats = merge_outcomes(check, [future.result()[check.name] for future in shard_futures])
+            yield check, results, stats
@@ -0,0 +1,191 @@
+"""Tests of the verification of models loaded into Prolog modules of their
+own, which need SWI-Prolog and tosca-parser. Run them from this directory
+with:
+
+    python -m unittest
+"""
+import os
+import tempfile
+import unittest
+
+import cache
+from batch import TYPES_MODULE, BatchLoader
+from incremental import IncrementalVerifier
+from poc import get_model_facts, retract_facts, run_check
+from server import Verifier
+
+CHECKS = """
+- name: hardcoded_password
+  description: Node $x has a hardcoded password.
+  distinct: true
+  check:
+    and:
+    - node:
+        $x:
+          type: $nodeType
+          properties:
+            password: $p
+    - predicate:
+        type_offers_capability:
+          args:
+          - $nodeType
+          - tosca.capabilities.Endpoint.Database
+    - not:
+        match:
+        - $p
+        - get_input:
+            args: [$_]
+
+- name: unsatisfied_requirement
+  description: node $nodeName has unsatisfied $typeReq
+  check:
+    and:
+    - node:
+        $nodeName:
+          type: $nodeType
+          requirements: $nodeReqs
+    - predicate:
+        type_has_requirement:
+          args: [$nodeType, $typeReq]
+    - not:
+        predicate:
+          requirement_satisfied:
+            args: [$nodeReqs, $typeReq]
+
+- name: policy_targets
+  description: policy $p targets $n.
+  check:
+    policy:
+      $p:
+        targets: [$n]
+"""
+
+# The database is given a password and a host, unless `password` and
+# `requirements` say otherwise
+MODEL = """
+tosca_definitions_version: tosca_simple_yaml_1_0
+
+node_types:
+  myapp.nodes.Database:
+    derived_from: tosca.nodes.Database
+
+topology_template:
+  inputs:
+    db_password:
+      type: string
+      default: changeme
+  node_templates:
+    server:
+      type: tosca.nodes.Compute
+    dbms:
+      type: tosca.nodes.DBMS
+      requirements:
+      - host: server
+    db:
+      type: myapp.nodes.Database
+      properties:
+        name: db
+        password: {password}
+      requirements: {requirements}
+  policies:
+  - placement:
+      type: tosca.policies.Placement
+      targets: [server]
+"""
+
+
+def write_model(dir_path: str, name: str, password: str = "secret", requirements: str = "[host: dbms]") -> str:
+    model_path = os.path.join(dir_path, name)
+    with open(model_path, "w") as model_f:
+        model_f.write(MODEL.format(password=password, requirements=requirements))
+    return model_path
+
+
+def setUpModule():
+    # Prolog is a singleton, so a single verifier is shared by the tests,
+    # with a cache of its own
+    global work_dir, verifier
+    work_dir = tempfile.TemporaryDirectory()
+    cache.CACHE_DIR = os.path.join(work_dir.name, "cache")
+    checks_path = os.path.join(work_dir.name, "checks.yaml")
+    with open(checks_path, "w") as checks_f:
+        checks_f.write(CHECKS)
+    verifier = Verifier(checks_path)
+
+
+def tearDownModule():
+    work_dir.cleanup()
+
+
+def get_bindings(result: dict, check_name: str, var: str) -> list[str]:
+    return sorted(violation["bindings"][var] for violation in result["violations"]
+        if violation["check"] == check_name)
+
+
+class VerifyModelTest(unittest.TestCase):
+    def test_model_facts_are_reached(self):
+        result = verifier.verify_model(write_model(work_dir.name, "model.yaml"), "model_0")
+        self.assertNotIn("error", result)
+        self.assertEqual(result["inconclusive"], [])
+        self.assertEqual(get_bindings(result, "hardcoded_password", "x"), ["db"])
+        self.assertEqual(get_bindings(result, "unsatisfied_requirement", "nodeName"), [])
+        self.assertEqual(get_bindings(result, "policy_targets", "n"), ["server"])
+
+    def test_models_are_verified_separately(self):
+        results = verifier.verify([
+            write_model(work_dir.name, "hardcoded.yaml"),
+            write_model(work_dir.name, "unhosted.yaml", password="{ get_input: db_password }", requirements="[]")
+        ])
+        self.assertNotIn("error", results[0])
+        self.assertNotIn("error", results[1])
+        self.assertEqual(get_bindings(results[0], "hardcoded_password", "x"), ["db"])
+        self.assertEqual(get_bindings(results[0], "unsatisfied_requirement", "nodeName"), [])
+        self.assertEqual(get_bindings(results[1], "hardcoded_password", "x"), [])
+        self.assertEqual(get_bindings(results[1], "unsatisfied_requirement", "nodeName"), ["db"])
+
+
+class IncrementalVerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.session = IncrementalVerifier(verifier.prolog, verifier.checks, "session_test")
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_only_dependent_checks_run_again(self):
+        delta = self.session.update(get_model_facts(write_model(work_dir.name, "v1.yaml")))
+        self.assertEqual(set(delta), {"hardcoded_password", "unsatisfied_requirement", "policy_targets"})
+        self.assertEqual(delta["hardcoded_password"], {"new": [{"$x": "db"}], "resolved": []})
+        self.assertEqual(delta["policy_targets"], {"new": [{"$p": "placement", "$n": "server"}], "resolved": []})
+
+        # Only the properties of the database change, which the policy
+        # check does not depend on
+        delta = self.session.update(get_model_facts(
+            write_model(work_dir.name, "v2.yaml", password="{ get_input: db_password }")))
+        self.assertEqual(set(delta), {"hardcoded_password", "unsatisfied_requirement"})
+        self.assertEqual(delta["hardcoded_password"], {"new": [], "resolved": [{"$x": "db"}]})
+        self.assertEqual(delta["unsatisfied_requirement"], {"new": [], "resolved": []})
+
+
+class BatchLoaderTest(unittest.TestCase):
+    modules = ["batch_0", "batch_1"]
+
+    def tearDown(self):
+        for module in self.modules + [TYPES_MODULE]:
+            retract_facts(verifier.prolog, module)
+
+    def get_results(self, module: str) -> dict[str, list[str]]:
+        # The first binding of each result of each check
+        return {check.name: sorted(list(res.values())[0] for res in run_check(verifier.prolog, check, module))
+            for check in verifier.checks}
+
+    def test_shared_types_are_reached(self):
+        loader = BatchLoader(verifier.prolog)
+        self.assertTrue(loader.load(get_model_facts(write_model(work_dir.name, "hardcoded.yaml")), "batch_0"))
+        self.assertTrue(loader.load(get_model_facts(write_model(work_dir.name, "unhosted.yaml",
+            password="{ get_input: db_password }", requirements="[]")), "batch_1"))
+        # The facts of the database type are only in the shared module
+        self.assertEqual(list(loader.type_facts), ["'myapp.nodes.Database'"])
+        self.assertEqual(self.get_results("batch_0"),
+            {"hardcoded_password": ["db"], "unsatisfied_requirement": [], "policy_targets": ["placement"]})
+        self.assertEqual(self.get_results("batch_1"),
+            {"hardcoded_password": [], "unsatisfied_requirement": ["db"], "policy_targets": ["placement"]})
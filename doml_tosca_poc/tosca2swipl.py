@@ -1,117 +1,175 @@
-import textwrap
-
-from toscaparser.elements.nodetype import NodeType
-from toscaparser.elements.property_definition import PropertyDef
-from toscaparser.elements.capabilitytype import CapabilityTypeDef
-from toscaparser.nodetemplate import NodeTemplate
-from toscaparser.policy import Policy
-from toscaparser.properties import Property
-from toscaparser.capabilities import Capability
-from toscaparser.functions import GetInput
-
-def build_property_def(prop_def: PropertyDef) -> str:
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+
+from check2swipl import quote
+
+# tosca-parser takes long to import, and is only needed when facts are
+# generated, so it is imported by the functions using it
+if TYPE_CHECKING:
+    from toscaparser.elements.nodetype import NodeType
+    from toscaparser.elements.property_definition import PropertyDef
+    from toscaparser.elements.capabilitytype import CapabilityTypeDef
+    from toscaparser.nodetemplate import NodeTemplate
+    from toscaparser.policy import Policy
+    from toscaparser.properties import Property
+    from toscaparser.elements.entity_type import EntityType
+
+# Bump whenever the facts generated for a model, or what is cached along
+# with them, change, so that fact bases cached on disk are invalidated
+FACTS_VERSION = 7
+
+def get_functor(fact: str) -> str:
+    return fact[:fact.index("(")]
+
+
+def get_parent_type_name(entity_type: EntityType) -> Optional[str]:
+    # Unlike `parent_type`, this does not build the parent type anew
+    if not hasattr(entity_type, "defs"):
+        return None
+    return entity_type.derived_from(entity_type.defs)
+
+
+def get_normative_type_names() -> set[str]:
+    from toscaparser.elements.entity_type import EntityType
+    # Unlike TOSCA_DEF, this is not extended with the types of profiles
+    defs = EntityType.TOSCA_DEF_LOAD_AS_IS
+    return set(defs.get("node_types") or {}) | set(defs.get("capability_types") or {})
+
+
+def build_ancestor_facts(functor: str, parents: dict[str, Optional[str]],
+        types: Optional[list[str]] = None) -> list[str]:
+    """Builds the `functor(Type, Ancestor)` facts of the transitive closure
+    of the hierarchy given by `parents`, which maps each type to its parent
+    type, for the given `types` or for all of them."""
+    ancestors: dict[str, list[str]] = {}
+    def get_ancestors(type_name: str) -> list[str]:
+        if type_name not in ancestors:
+            parent = parents.get(type_name)
+            ancestors[type_name] = [] if parent is None else [parent] + get_ancestors(parent)
+        return ancestors[type_name]
+    return [f"{functor}({quote(type_name)}, {quote(ancestor)})"
+        for type_name in (parents if types is None else types)
+        for ancestor in get_ancestors(type_name)]
+
+
+def build_property_def_args(prop_def: PropertyDef) -> str:
     requiredness = "true" if prop_def.required else "false"
-    return f"property({prop_def.name}, {prop_def.schema['type']}, {requiredness})"
-
-
-def build_node_type_fact(node_type: NodeType) -> str:
-    prop_defs = "[" \
-        + ", ".join([build_property_def(prop_def) for prop_def in node_type.get_properties_def_objects()]) \
-        + "]"
-
-    def build_capability_def(cap_def: CapabilityTypeDef):
-        return f"capability({cap_def.name}, '{cap_def.type}')"
-    cap_defs = "[" \
-        + ", ".join([build_capability_def(cap_def) for cap_def in node_type.get_capabilities_objects()]) \
-        + "]"
-
-    def build_type_requirement(req_name, req_def):
-        req_cap = req_def.get("capability", "tosca.capabilities.Root")
-        req_node = req_def.get("node", "tosca.nodes.Root")
-        req_rel = req_def.get("relationship", "tosca.relationships.Root")
-        occ = req_def.get("occurrences")
-        if occ is None:
-            req_occ = "occurrences(1, unbounded)"
-        else:
-            req_occ = f"occurrences({occ[0]}, {'unbounded' if occ[1] == 'UNBOUNDED' else occ[1]})"
-        return f"requirement({req_name}, '{req_cap}', '{req_node}', '{req_rel}', {req_occ})"
-    req_l = []
+    return f"{quote(prop_def.name)}, {quote(prop_def.schema['type'])}, {requiredness}"
+
+
+def build_type_requirement_args(req_name, req_def) -> str:
+    req_cap = req_def.get("capability", "tosca.capabilities.Root")
+    req_node = req_def.get("node", "tosca.nodes.Root")
+    req_rel = req_def.get("relationship", "tosca.relationships.Root")
+    occ = req_def.get("occurrences")
+    if occ is None:
+        req_occ = "occurrences(1, unbounded)"
+    else:
+        req_occ = f"occurrences({occ[0]}, {'unbounded' if occ[1] == 'UNBOUNDED' else occ[1]})"
+    return f"{quote(req_name)}, {quote(req_cap)}, {quote(req_node)}, {quote(req_rel)}, {req_occ}"
+
+
+# Besides the node_type/5, cap_type/3, node/5 and policy/3 facts, whose
+# arguments hold lists, each build_*_facts function emits their contents
+# as flat relations, that can be looked up through argument indexing
+
+def build_node_type_facts(node_type: NodeType) -> list[str]:
+    type_name = quote(node_type.type)
+    prop_defs = [build_property_def_args(prop_def) for prop_def in node_type.get_properties_def_objects()]
+    cap_defs = [f"{quote(cap_def.name)}, {quote(cap_def.type)}" for cap_def in node_type.get_capabilities_objects()]
+    req_defs = []
     for req in node_type.requirements:  # type: ignore
         req_name = list(req)[0] # Gets the first key of req
-        req_def = req[req_name]
-        req_l.append(build_type_requirement(req_name, req_def))
-    requirements = "[" + ", ".join(req_l) + "]"
-
-    return textwrap.dedent(f"""
-    node_type(
-        '{node_type.type}',
-        '{node_type.parent_type.type if node_type.parent_type is not None else 'none'}',
-        {prop_defs},
-        {cap_defs},
-        {requirements}
-    )""")
-
-
-def build_cap_type_fact(captype: CapabilityTypeDef) -> str:
-    prop_defs = "[" \
-        + ", ".join([build_property_def(prop_def) for prop_def in captype.get_properties_def_objects()]) \
-        + "]"
-    
-    return textwrap.dedent(f"""
-    cap_type(
-        '{captype.type}',
-        '{captype.parent_type.type if captype.parent_type is not None else 'none'}',
-        {prop_defs}
-    )""")
-
-
-def build_node_fact(node_tpl: NodeTemplate) -> str:
-    def build_node_property(prop: Property) -> str:
-        if type(prop.value) in [int, float]:
-            prop_val_str = str(prop.value)
-        elif type(prop.value) is str:
-            prop_val_str = '"' + prop.value + '"' # TODO: escaping
-        elif type(prop.value) is bool:
-            prop_val_str = "true" if prop.value else "false"
-        elif type(prop.value) is GetInput:
-            prop_val_str = f"get_input({prop.value.args[0]})"
-        else:
-            raise ValueError(f"Property type {type(prop.value)} not handled.")
-        return f"property({prop.name}, {prop_val_str})"
-    properties = "[" \
-        + ", ".join([build_node_property(prop) for prop in node_tpl.get_properties_objects()]) \
-        + "]"
-    
-    def build_node_capability(cap: Capability):
-        properties = "[" \
-            + ", ".join([build_node_property(prop) for prop in cap.get_properties_objects()]) \
-            + "]"
-        return f"capability({cap.name}, {properties})"
-    capabilities = "[" \
-        + ", ".join([build_node_capability(cap) for cap in node_tpl.get_capabilities_objects()]) \
-        + "]"
-
-    def build_node_requirement(req):
+        req_defs.append(build_type_requirement_args(req_name, req[req_name]))
+
+    parent_type = quote(get_parent_type_name(node_type) or 'none')
+    prop_defs_list = ", ".join(f"property({prop_def})" for prop_def in prop_defs)
+    cap_defs_list = ", ".join(f"capability({cap_def})" for cap_def in cap_defs)
+    req_defs_list = ", ".join(f"requirement({req_def})" for req_def in req_defs)
+    return [f"node_type({type_name}, {parent_type}, [{prop_defs_list}], [{cap_defs_list}], [{req_defs_list}])"] \
+        + [f"node_type_property({type_name}, {prop_def})" for prop_def in prop_defs] \
+        + [f"node_type_capability({type_name}, {cap_def})" for cap_def in cap_defs] \
+        + [f"node_type_requirement({type_name}, {req_def})" for req_def in req_defs]
+
+
+def build_cap_type_facts(captype: CapabilityTypeDef) -> list[str]:
+    type_name = quote(captype.type)
+    prop_defs = [build_property_def_args(prop_def) for prop_def in captype.get_properties_def_objects()]
+
+    parent_type = quote(get_parent_type_name(captype) or 'none')
+    prop_defs_list = ", ".join(f"property({prop_def})" for prop_def in prop_defs)
+    return [f"cap_type({type_name}, {parent_type}, [{prop_defs_list}])"] \
+        + [f"cap_type_property({type_name}, {prop_def})" for prop_def in prop_defs]
+
+
+def build_property_args(prop: Property) -> str:
+    from toscaparser.functions import GetInput
+    if type(prop.value) in [int, float]:
+        prop_val_str = str(prop.value)
+    elif type(prop.value) is str:
+        prop_val_str = quote(prop.value, delimiter='"')
+    elif type(prop.value) is bool:
+        prop_val_str = "true" if prop.value else "false"
+    elif type(prop.value) is GetInput:
+        prop_val_str = f"get_input({quote(prop.value.args[0])})"
+    else:
+        raise ValueError(f"Property type {type(prop.value)} not handled.")
+    return f"{quote(prop.name)}, {prop_val_str}"
+
+
+def build_node_facts(node_tpl: NodeTemplate) -> list[str]:
+    node_name = quote(node_tpl.name)
+    props = [build_property_args(prop) for prop in node_tpl.get_properties_objects()]
+    caps = [(quote(cap.name), [build_property_args(prop) for prop in cap.get_properties_objects()])
+        for cap in node_tpl.get_capabilities_objects()]
+    reqs = []
+    for req in node_tpl.requirements:
         req_name = list(req)[0]
-        return f"requirement({req_name}, {req[req_name]})"
-    requirements = "[" \
-        + ", ".join([build_node_requirement(req) for req in node_tpl.requirements]) \
-        + "]"
-
-    return textwrap.dedent(f"""
-    node(
-        {node_tpl.name},
-        '{node_tpl.type}',
-        {properties},
-        {capabilities},
-        {requirements}
-    )""")
-
-
-def build_policy_fact(pol: Policy) -> str:
-    return textwrap.dedent(f"""
-    policy(
-        {pol.name},
-        '{pol.type}',
-        [{", ".join(pol.targets)}]
-    )""")
+        # Requirements are either `name: node` or in extended notation,
+        # where the target node may be left to be found by capability or
+        # node filter, in which case the requirement has no target yet
+        req_node = req[req_name].get("node") if type(req[req_name]) is dict else req[req_name]
+        if req_node is None:
+            continue
+        reqs.append(f"{quote(req_name)}, {quote(req_node)}")
+
+    props_list = ", ".join(f"property({prop})" for prop in props)
+    caps_list = ", ".join(
+        f"capability({cap_name}, [{', '.join(f'property({prop})' for prop in cap_props)}])"
+        for cap_name, cap_props in caps)
+    reqs_list = ", ".join(f"requirement({req})" for req in reqs)
+    return [f"node({node_name}, {quote(node_tpl.type)}, [{props_list}], [{caps_list}], [{reqs_list}])"] \
+        + [f"node_property({node_name}, {prop})" for prop in props] \
+        + [f"node_capability({node_name}, {cap_name})" for cap_name, _ in caps] \
+        + [f"node_capability_property({node_name}, {cap_name}, {prop})"
+            for cap_name, cap_props in caps
+            for prop in cap_props] \
+        + [f"node_requirement({node_name}, {req})" for req in reqs]
+
+
+def build_policy_facts(pol: Policy) -> list[str]:
+    pol_name = quote(pol.name)
+    targets = [quote(target) for target in pol.targets]
+    return [f"policy({pol_name}, {quote(pol.type)}, [{', '.join(targets)}])"] \
+        + [f"policy_target({pol_name}, {target})" for target in targets]
+
+
+def build_normative_facts() -> list[str]:
+    """Builds the facts of all the normative node and capability types,
+    which are loaded once rather than with the facts of each model."""
+    from toscaparser.elements.capabilitytype import CapabilityTypeDef
+    from toscaparser.elements.nodetype import NodeType
+    type_names = sorted(get_normative_type_names())
+    node_types = [NodeType(name) for name in type_names if name.startswith(NodeType.NODE_PREFIX)]
+    cap_types = [CapabilityTypeDef(name, name, None)
+        for name in type_names if name.startswith(CapabilityTypeDef.CAPABILITY_PREFIX)]
+    facts = []
+    for node_type in node_types:
+        facts.extend(build_node_type_facts(node_type))
+    for cap_type in cap_types:
+        facts.extend(build_cap_type_facts(cap_type))
+    facts.extend(build_ancestor_facts("node_type_ancestor",
+        {node_type.type: get_parent_type_name(node_type) for node_type in node_types}))
+    facts.extend(build_ancestor_facts("cap_type_ancestor",
+        {cap_type.type: get_parent_type_name(cap_type) for cap_type in cap_types}))
+    return facts